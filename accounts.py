@@ -0,0 +1,167 @@
+"""멀티 계정 토큰 풀 - 여러 ChatGPT 계정의 auth.json으로 처리량 분산
+
+- AUTH_POOL_DIR의 *.json 파일마다 TokenManager 하나 (없으면 ~/.codex/auth.json 한 개)
+- 선택: 대화별 sticky (프롬프트 캐시 유지) → 없으면 least_loaded / round_robin
+- 429를 받은 계정은 Retry-After(없으면 AUTH_COOLDOWN초) 동안 선택에서 제외
+- 계정별 요청 수, 진행 중 요청, 429 횟수, 토큰 사용량 집계
+"""
+import glob
+import itertools
+import os
+import time
+import weakref
+from contextlib import aclosing
+from typing import AsyncIterator, Callable
+
+import httpx
+
+from auth import AUTH_PATH, TokenManager
+from cache import LRUCache
+from log import get_logger
+
+logger = get_logger("accounts")
+
+# auth.json 파일들이 있는 디렉토리 (비어 있으면 AUTH_PATH 한 개만 사용)
+AUTH_POOL_DIR = os.path.expanduser(os.getenv("AUTH_POOL_DIR", ""))
+# 계정 선택 방식: least_loaded | round_robin
+AUTH_POOL_STRATEGY = os.getenv("AUTH_POOL_STRATEGY", "least_loaded").lower()
+# 429 후 Retry-After가 없을 때 계정을 쉬게 하는 시간 (초)
+AUTH_COOLDOWN = float(os.getenv("AUTH_COOLDOWN", "60"))
+# 대화 → 계정 sticky 매핑 최대 수
+AUTH_STICKY_ENTRIES = int(os.getenv("AUTH_STICKY_ENTRIES", "10000"))
+
+
+class Account:
+    def __init__(self, name: str, manager: TokenManager):
+        self.name = name
+        self.manager = manager
+        self.active = 0
+        self.cooldown_until = 0.0
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def available(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+    def cool_down(self, seconds: float | None):
+        seconds = AUTH_COOLDOWN if seconds is None else seconds
+        self.rate_limited += 1
+        self.cooldown_until = max(self.cooldown_until, time.time() + seconds)
+        logger.warning("🧊 Account %s rate limited → cooldown %.0fs", self.name, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cooldown": max(round(self.cooldown_until - time.time(), 1), 0.0),
+            "token_expired": self.manager.is_expired(),
+        }
+
+
+class TokenPool:
+    def __init__(self, pool_dir: str = AUTH_POOL_DIR):
+        self.accounts: list[Account] = []
+        if pool_dir:
+            for path in sorted(glob.glob(os.path.join(pool_dir, "*.json"))):
+                name = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    self.accounts.append(Account(name, TokenManager(path)))
+                except (OSError, ValueError) as e:
+                    logger.warning("auth 파일 무시 (%s): %s", path, e)
+            if not self.accounts:
+                logger.warning("AUTH_POOL_DIR=%s 에 auth 파일 없음 → %s 사용", pool_dir, AUTH_PATH)
+        if not self.accounts:
+            self.accounts.append(Account("default", TokenManager(AUTH_PATH)))
+        else:
+            logger.info("👥 Token pool: %d accounts (%s)", len(self.accounts), AUTH_POOL_STRATEGY)
+
+        self._sticky = LRUCache(AUTH_STICKY_ENTRIES)
+        self._round_robin = itertools.cycle(self.accounts)
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def select(self, session_id: str, exclude: set[str] = frozenset()) -> Account | None:
+        """대화에 쓸 계정 선택 (쉬는 중/제외된 계정 빼고, 없으면 None)"""
+        now = time.time()
+        candidates = [a for a in self.accounts if a.name not in exclude and a.available(now)]
+        if not candidates:
+            return None
+
+        sticky = self._sticky.get(session_id)
+        account = next((a for a in candidates if a.name == sticky), None)
+        if account is None:
+            if AUTH_POOL_STRATEGY == "round_robin":
+                account = next(a for a in self._round_robin if a in candidates)
+            else:
+                account = min(candidates, key=lambda a: (a.active, a.requests))
+            self._sticky.put(session_id, account.name)
+        return account
+
+    def retry_in(self) -> float:
+        """모든 계정이 쉬는 중일 때 가장 빨리 풀리는 시간 (초)"""
+        return max(min(a.cooldown_until for a in self.accounts) - time.time(), 0.0)
+
+    def track(self, account: Account, events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """이벤트 스트림이 끝날 때까지 계정의 진행 중 요청으로 집계 + usage 기록"""
+        account.active += 1
+        account.requests += 1
+        done = _Once(account)
+        stream = _tracking(account, events, done)
+        weakref.finalize(stream, done)
+        return stream
+
+    def is_expired(self) -> bool:
+        return any(a.manager.is_expired() for a in self.accounts)
+
+    def start_background_refresh(self, client_factory: Callable[[], httpx.AsyncClient] | None = None):
+        for account in self.accounts:
+            account.manager.start_background_refresh(client_factory)
+
+    async def stop_background_refresh(self):
+        for account in self.accounts:
+            await account.manager.stop_background_refresh()
+
+    def stats(self) -> dict:
+        return {a.name: a.stats() for a in self.accounts}
+
+
+class _Once:
+    """진행 중 요청 수 감소 (한 번만 적용)"""
+
+    __slots__ = ("account", "done", "__weakref__")
+
+    def __init__(self, account: Account):
+        self.account = account
+        self.done = False
+
+    def __call__(self):
+        if not self.done:
+            self.done = True
+            self.account.active -= 1
+
+
+async def _tracking(
+    account: Account, events: AsyncIterator[dict], done: _Once
+) -> AsyncIterator[dict]:
+    try:
+        async with aclosing(events):
+            async for event in events:
+                if event.get("type") == "response.completed":
+                    usage = event.get("response", {}).get("usage", {})
+                    account.input_tokens += usage.get("input_tokens", 0)
+                    account.output_tokens += usage.get("output_tokens", 0)
+                yield event
+    except Exception:
+        account.errors += 1
+        raise
+    finally:
+        done()
@@ -1,29 +1,124 @@
-"""OAuth 토큰 관리 - ~/.codex/auth.json 읽기 + 자동 갱신"""
+"""OAuth 토큰 관리 - ~/.codex/auth.json 읽기 + 자동 갱신
+
+여러 워커 프로세스(WORKERS)가 같은 auth.json을 쓰면
+- 갱신은 auth.json.lock 파일 잠금 안에서 하고, 잠금을 얻은 뒤 파일이 바뀌어 있으면
+  (다른 워커가 이미 갱신) 다시 읽기만 한다 → refresh_token을 한 번만 사용
+- 파일이 바뀌면 (다른 워커의 갱신, codex login 재실행) 다음 요청에서 다시 읽는다
+"""
+import asyncio
 import json
 import os
 import time
 import base64
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Callable
 import httpx
 
+try:
+    import fcntl
+except ImportError:  # Windows - 파일 잠금 없이 동작 (단일 워커)
+    fcntl = None
+
+from log import get_logger
+
+logger = get_logger("auth")
+
 AUTH_PATH = os.path.expanduser("~/.codex/auth.json")
 # Codex CLI의 OAuth client_id
 CLIENT_ID = "app_EMoamEEZ73f0CkXaXp7hrann"
 TOKEN_URL = "https://auth.openai.com/oauth/token"
 
+# 만료 판정 여유 시간 (초) - 이 시간 안에 만료되면 만료로 간주
+EXPIRY_SKEW = 60
+# 만료 N초 전부터 백그라운드에서 미리 갱신
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+# 백그라운드 갱신 실패 시 재시도 간격 (초)
+TOKEN_REFRESH_RETRY = 30
+# auth.json 변경 확인 간격 (초) - 다른 워커/프로세스가 갱신한 토큰 반영
+AUTH_RELOAD_INTERVAL = float(os.getenv("AUTH_RELOAD_INTERVAL", "1"))
+# 다른 워커의 갱신을 기다리는 최대 시간 (초)
+AUTH_LOCK_TIMEOUT = 30
+
 
 class TokenManager:
     def __init__(self, auth_path: str = AUTH_PATH):
         self.auth_path = auth_path
         self._data = None
+        # (access_token, exp) - 토큰이 바뀔 때만 JWT 디코드
+        self._exp_cache: tuple[str, float] | None = None
+        # 진행 중인 갱신 작업 (동시 요청은 이 작업 하나를 공유)
+        self._refresh_task: asyncio.Task | None = None
+        self._background_task: asyncio.Task | None = None
+        # 마지막으로 읽은/쓴 auth.json의 (mtime_ns, size)와 확인 시각
+        self._file_sig: tuple[int, int] | None = None
+        self._checked_at = 0.0
         self._load()
 
     def _load(self):
         with open(self.auth_path) as f:
             self._data = json.load(f)
+            self._file_sig = _file_sig(f.fileno())
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """auth.json이 바뀌었으면 다시 읽기 (AUTH_RELOAD_INTERVAL마다 stat 한 번)"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < AUTH_RELOAD_INTERVAL:
+            return False
+        self._checked_at = now
+        try:
+            if _file_sig(self.auth_path) == self._file_sig:
+                return False
+            self._load()
+        except (OSError, ValueError) as e:
+            logger.warning("auth.json 다시 읽기 실패: %s", e)
+            return False
+        logger.info("🔑 auth.json changed on disk → reloaded | expires in %ds", int(self.expires_in()))
+        return True
+
+    @asynccontextmanager
+    async def _file_lock(self):
+        """auth.json.lock 배타 잠금 (다른 워커가 잡고 있으면 이벤트 루프를 막지 않고 폴링)"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.auth_path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            deadline = time.monotonic() + AUTH_LOCK_TIMEOUT
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        logger.warning("auth.json 잠금 대기 시간 초과 → 잠금 없이 갱신")
+                        break
+                    await asyncio.sleep(0.05)
+            yield
+        finally:
+            os.close(fd)  # 잠금도 함께 해제
 
     def _save(self):
-        with open(self.auth_path, "w") as f:
-            json.dump(self._data, f, indent=2)
+        """임시 파일에 쓴 뒤 rename - 저장 중 크래시가 나도 auth.json이 깨지지 않음"""
+        directory = os.path.dirname(self.auth_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".auth.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.chmod(tmp_path, os.stat(self.auth_path).st_mode & 0o777)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, self.auth_path)
+            self._file_sig = _file_sig(self.auth_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
 
     @property
     def tokens(self) -> dict:
@@ -41,41 +136,82 @@ class TokenManager:
     def refresh_token(self) -> str | None:
         return self.tokens.get("refresh_token")
 
-    def is_expired(self) -> bool:
-        """JWT의 exp 클레임으로 만료 여부 확인"""
+    def _token_exp(self) -> float:
+        """JWT의 exp 클레임 (토큰별로 한 번만 디코드)"""
         token = self.access_token
         if not token:
-            return True
+            return 0.0
+        if self._exp_cache and self._exp_cache[0] == token:
+            return self._exp_cache[1]
         try:
             payload_b64 = token.split(".")[1]
             # base64 패딩 추가
             payload_b64 += "=" * (4 - len(payload_b64) % 4)
             payload = json.loads(base64.urlsafe_b64decode(payload_b64))
-            # 만료 60초 전에 갱신
-            return payload.get("exp", 0) < (time.time() + 60)
+            exp = float(payload.get("exp", 0))
         except Exception:
-            return True
+            exp = 0.0
+        self._exp_cache = (token, exp)
+        return exp
+
+    def expires_in(self) -> float:
+        """만료까지 남은 시간 (초)"""
+        return self._token_exp() - time.time()
+
+    def is_expired(self) -> bool:
+        """JWT의 exp 클레임으로 만료 여부 확인"""
+        # 만료 60초 전에 갱신
+        return self.expires_in() < EXPIRY_SKEW
 
-    async def refresh_if_needed(self):
-        """만료된 경우 토큰 갱신"""
+    async def refresh_if_needed(self, client: httpx.AsyncClient | None = None):
+        """만료된 경우 토큰 갱신 (client가 주어지면 공유 커넥션 풀 사용)
+
+        - 유효: 즉시 반환 (만료가 가까우면 백그라운드 갱신만 예약)
+        - 만료: 진행 중인 갱신 작업 하나를 모든 요청이 함께 대기
+        """
+        self.reload_if_changed()
         if not self.is_expired():
+            if self.expires_in() < TOKEN_REFRESH_MARGIN:
+                self._start_refresh(client)
             return
+        await asyncio.shield(self._start_refresh(client))
+
+    def _start_refresh(self, client: httpx.AsyncClient | None) -> asyncio.Task:
+        """갱신 작업 시작 (이미 진행 중이면 그 작업을 반환 - single-flight)"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(client))
+            self._refresh_task.add_done_callback(_log_refresh_failure)
+        return self._refresh_task
+
+    async def _refresh(self, client: httpx.AsyncClient | None = None):
+        """refresh_token으로 새 access_token 발급 + 저장 (워커 간 파일 잠금)"""
+        stale_token = self.access_token
+        async with self._file_lock():
+            # 잠금을 기다리는 동안 다른 워커가 갱신했으면 파일만 다시 읽음
+            self.reload_if_changed(force=True)
+            if self.access_token != stale_token:
+                logger.info("🔑 Token refreshed by another process | expires in %ds", int(self.expires_in()))
+                return
+            await self._refresh_locked(client)
+
+    async def _refresh_locked(self, client: httpx.AsyncClient | None):
         rt = self.refresh_token
         if not rt:
             raise RuntimeError("refresh_token 없음 - codex login 재실행 필요")
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                TOKEN_URL,
-                json={
-                    "grant_type": "refresh_token",
-                    "refresh_token": rt,
-                    "client_id": CLIENT_ID,
-                },
-            )
-            if resp.status_code != 200:
-                raise RuntimeError(f"토큰 갱신 실패: {resp.status_code} {resp.text}")
-            data = resp.json()
+        payload = {
+            "grant_type": "refresh_token",
+            "refresh_token": rt,
+            "client_id": CLIENT_ID,
+        }
+        if client is not None:
+            resp = await client.post(TOKEN_URL, json=payload)
+        else:
+            async with httpx.AsyncClient() as own_client:
+                resp = await own_client.post(TOKEN_URL, json=payload)
+        if resp.status_code != 200:
+            raise RuntimeError(f"토큰 갱신 실패: {resp.status_code} {resp.text}")
+        data = resp.json()
 
         # 토큰 업데이트
         self._data["tokens"]["access_token"] = data["access_token"]
@@ -85,6 +221,48 @@ class TokenManager:
             "%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime()
         )
         self._save()
+        logger.info("🔑 Token refreshed | expires in %ds", int(self.expires_in()))
+
+    def start_background_refresh(
+        self, client_factory: Callable[[], httpx.AsyncClient] | None = None
+    ):
+        """만료 TOKEN_REFRESH_MARGIN초 전에 미리 갱신하는 백그라운드 루프 시작"""
+        if self._background_task is None or self._background_task.done():
+            self._background_task = asyncio.create_task(
+                self._background_loop(client_factory)
+            )
+
+    async def stop_background_refresh(self):
+        task, self._background_task = self._background_task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _background_loop(self, client_factory):
+        while True:
+            delay = self.expires_in() - TOKEN_REFRESH_MARGIN
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # 자는 동안 다른 워커가 이미 갱신했으면 파일만 다시 읽고 새 만료 시각까지 대기
+            self.reload_if_changed(force=True)
+            if self.expires_in() >= TOKEN_REFRESH_MARGIN:
+                continue
+            client = client_factory() if client_factory else None
+            try:
+                await asyncio.shield(self._start_refresh(client))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # 실패는 done 콜백에서 로깅됨 - 잠시 후 재시도
+                await asyncio.sleep(TOKEN_REFRESH_RETRY)
+                continue
+            # 새 토큰의 수명이 여유 시간보다 짧으면 갱신 폭주 방지
+            if self.expires_in() < TOKEN_REFRESH_MARGIN:
+                await asyncio.sleep(TOKEN_REFRESH_RETRY)
 
     def get_headers(self) -> dict:
         """OpenAI API 호출용 인증 헤더"""
@@ -95,3 +273,16 @@ class TokenManager:
         if self.account_id:
             headers["chatgpt-account-id"] = self.account_id
         return headers
+
+
+def _file_sig(path_or_fd: str | int) -> tuple[int, int]:
+    st = os.stat(path_or_fd)
+    return st.st_mtime_ns, st.st_size
+
+
+def _log_refresh_failure(task: asyncio.Task):
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.warning("Token refresh failed: %s", exc)
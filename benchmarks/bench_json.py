@@ -0,0 +1,117 @@
+"""요청 경로 JSON 벤치마크 - 큰 대화 본문의 파싱 → 변환 → 업스트림 본문 직렬화 처리량
+
+표준 json (request.json() + httpx json=) 과 fastjson (orjson 있으면 사용) 비교.
+변환은 양쪽 모두 같은 anthropic_to_responses를 쓰고, 메시지 변환 캐시를 비운 cold 변환과
+Claude Code처럼 마지막 턴만 새로운 warm 변환을 따로 잰다. SSE 이벤트 파싱도 함께 비교.
+
+사용법:
+    python benchmarks/bench_json.py                       # 200턴 합성 대화
+    python benchmarks/bench_json.py --turns 1000 --tool-output-kb 8
+    python benchmarks/bench_json.py --file request.json   # 캡처한 /v1/messages 요청 본문
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import converter  # noqa: E402
+import fastjson  # noqa: E402
+from converter import anthropic_to_responses  # noqa: E402
+
+
+def synthetic_body(turns: int, tool_output_kb: int) -> dict:
+    """Read/Bash tool 호출이 섞인 긴 Claude Code 대화"""
+    output = "\n".join(f"{i:5d}\tdef handler_{i}(request): return 'ok 한글'" for i in range(tool_output_kb * 20))
+    messages = []
+    for t in range(turns):
+        messages.append({"role": "user", "content": [
+            {"type": "text", "text": "<system-reminder>\nTodo list is empty.\n</system-reminder>"},
+            {"type": "text", "text": f"turn {t}: 이 파일의 handler를 정리해줘 " * 4},
+        ]})
+        messages.append({"role": "assistant", "content": [
+            {"type": "text", "text": "파일을 먼저 읽겠습니다."},
+            {"type": "tool_use", "id": f"toolu_{t:06d}", "name": "Read",
+             "input": {"file_path": f"/repo/src/module_{t}.py", "limit": 2000}},
+        ]})
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": f"toolu_{t:06d}", "content": output[: (t % 5 + 1) * 1000]},
+        ]})
+        messages.append({"role": "assistant", "content": f"정리했습니다 ({t})."})
+    tools = [{"name": f"Tool{i}", "description": "tool description " * 20,
+              "input_schema": {"type": "object", "properties": {"arg": {"type": "string"}}}}
+             for i in range(20)]
+    return {"model": "claude-sonnet-4", "max_tokens": 32000, "stream": True,
+            "system": "You are Claude Code. " * 200, "tools": tools, "messages": messages}
+
+
+def synthetic_sse(n_events: int) -> list[str]:
+    return [json.dumps({"type": "response.output_text.delta", "item_id": "msg_0", "output_index": 0,
+                        "content_index": 0, "delta": f"tok{i % 100} 토큰 "}) for i in range(n_events)]
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", help="캡처한 Anthropic /v1/messages 요청 본문 (JSON)")
+    ap.add_argument("--turns", type=int, default=200, help="합성 대화 턴 수")
+    ap.add_argument("--tool-output-kb", type=int, default=4, help="tool 결과 최대 크기 (KB)")
+    ap.add_argument("--sse-events", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            raw = f.read()
+    else:
+        raw = json.dumps(synthetic_body(args.turns, args.tool_output_kb)).encode()
+    body = json.loads(raw)
+    print(f"body: {len(raw) / 1e6:.2f} MB, {len(body.get('messages', []))} messages, "
+          f"fastjson backend: {fastjson.backend()}")
+
+    def cold_convert():
+        converter._message_cache.clear()
+        converter._preamble_cache.clear()
+        return anthropic_to_responses(body)
+
+    resp_body = cold_convert()
+    rows = [
+        ("parse request", lambda: json.loads(raw), lambda: fastjson.loads(raw)),
+        ("serialize upstream", lambda: json.dumps(resp_body).encode(), lambda: fastjson.dumps(resp_body)),
+    ]
+    sse = synthetic_sse(args.sse_events)
+    rows.append(("parse SSE events", lambda: [json.loads(e) for e in sse], lambda: [fastjson.loads(e) for e in sse]))
+
+    print(f"{'':>20}  {'stdlib':>10}  {'fastjson':>10}  speedup")
+    for name, legacy, fast in rows:
+        a, b = best_of(legacy, args.repeat), best_of(fast, args.repeat)
+        print(f"{name:>20}  {a * 1000:8.2f}ms  {b * 1000:8.2f}ms  {a / b:5.1f}x")
+    print(f"{'upstream body size':>20}  {len(json.dumps(resp_body).encode()) / 1e6:8.2f}MB  "
+          f"{len(fastjson.dumps(resp_body)) / 1e6:8.2f}MB")
+
+    # 변환 자체는 양쪽 공통 (내부 캐시 키에 fastjson 사용)
+    cold = best_of(cold_convert, args.repeat)
+    anthropic_to_responses(body)
+    warm = best_of(lambda: anthropic_to_responses(body), args.repeat)
+    print(f"{'convert (cold)':>20}  {cold * 1000:8.2f}ms")
+    print(f"{'convert (warm)':>20}  {warm * 1000:8.2f}ms")
+
+    legacy_total = best_of(lambda: json.dumps(anthropic_to_responses(json.loads(raw))).encode(), args.repeat)
+    fast_total = best_of(lambda: fastjson.dumps(anthropic_to_responses(fastjson.loads(raw))), args.repeat)
+    mb = len(raw) / 1e6
+    print(f"{'end-to-end (warm)':>20}  {legacy_total * 1000:8.2f}ms  {fast_total * 1000:8.2f}ms  "
+          f"{legacy_total / fast_total:5.1f}x  ({mb / legacy_total:.0f} → {mb / fast_total:.0f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
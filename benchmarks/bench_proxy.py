@@ -0,0 +1,388 @@
+"""프록시 부하/오버헤드 벤치마크 - 모의 Responses 서버 + 동시 요청 드라이버
+
+모의 업스트림(benchmarks/mock_upstream.py)을 이 프로세스 안에서 띄우고, 프록시(server.py)를
+별도 프로세스로 실행해 /v1/messages 를 설정한 동시성으로 호출한다. 모의 서버가 요청별
+수신/첫 델타/종료 시각을 기록하므로 프록시가 더한 지연만 따로 계산할 수 있다.
+
+측정 항목 (시나리오별):
+- latency_ms: 클라이언트 기준 전체 시간 p50/p95/p99
+- overhead_ms: 전체 시간 - 업스트림(모의 서버) 처리 시간
+- ttft_ms / ttft_overhead_ms: 첫 content_block_delta 까지 시간 / 그중 프록시 몫
+- events_per_sec: 클라이언트가 받은 SSE 이벤트 처리량
+- cpu_ms_per_request: 프록시 프로세스 CPU 시간 / 요청 수 (Linux /proc 또는 psutil)
+
+사용법:
+    python benchmarks/bench_proxy.py                                    # 기본 4개 시나리오
+    python benchmarks/bench_proxy.py --concurrency 32 --requests 500 --token-rate 100
+    python benchmarks/bench_proxy.py --scenarios stream,stream-tools --output results.json
+    python benchmarks/bench_proxy.py --compare baseline.json            # 이전 결과와 비교
+    python benchmarks/bench_proxy.py --proxy-url http://127.0.0.1:8082  # 이미 실행 중인 프록시
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_upstream import MockConfig, MockState, create_app, load_replay  # noqa: E402
+
+SCENARIOS = {
+    "stream": {"stream": True, "tools": False},
+    "stream-tools": {"stream": True, "tools": True},
+    "json": {"stream": False, "tools": False},
+    "json-tools": {"stream": False, "tools": True},
+}
+
+_TOOLS = [
+    {
+        "name": name,
+        "description": f"{name} tool " + "with a fairly long description. " * 20,
+        "input_schema": {
+            "type": "object",
+            "properties": {"file_path": {"type": "string"}, "limit": {"type": "integer"}},
+            "required": ["file_path"],
+        },
+    }
+    for name in ("Read", "Write", "Edit", "Bash", "Grep", "Glob", "WebFetch", "Task")
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _history(turns: int) -> list[dict]:
+    """요청마다 같은 대화 이력 (실제 Claude Code처럼 앞부분은 반복되고 마지막 메시지만 새로움)"""
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i}: " + "context line. " * 40})
+        messages.append({"role": "assistant", "content": [
+            {"type": "text", "text": f"answer {i} " + "explanation. " * 30},
+        ]})
+    return messages
+
+
+def build_body(n: int, scenario: dict, history: list[dict]) -> dict:
+    body = {
+        "model": "claude-sonnet-4-5-20250929",
+        "max_tokens": 4096,
+        "stream": scenario["stream"],
+        "system": "You are a helpful coding assistant. " * 30,
+        "messages": history + [{"role": "user", "content": f"bench-req-{n} please continue"}],
+    }
+    if scenario["tools"]:
+        body["tools"] = _TOOLS
+    return body
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 3)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "mean": round(sum(ordered) / len(ordered), 3)}
+
+
+def _cpu_seconds(pid: int | None) -> float | None:
+    """프록시 프로세스의 누적 CPU 시간 (user + system)"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    times = psutil.Process(pid).cpu_times()
+    return times.user + times.system
+
+
+async def _one_request(client: httpx.AsyncClient, url: str, n: int, scenario: dict,
+                       history: list[dict]) -> dict:
+    body = build_body(n, scenario, history)
+    started = time.perf_counter()
+    first_delta = 0.0
+    events = 0
+    status = 0
+    if scenario["stream"]:
+        async with client.stream("POST", url, json=body) as resp:
+            status = resp.status_code
+            async for line in resp.aiter_lines():
+                if line.startswith("event:"):
+                    events += 1
+                    if not first_delta and line.endswith("content_block_delta"):
+                        first_delta = time.perf_counter()
+    else:
+        resp = await client.post(url, json=body)
+        status = resp.status_code
+        first_delta = time.perf_counter()
+    return {"n": n, "status": status, "started": started, "first_delta": first_delta,
+            "finished": time.perf_counter(), "events": events}
+
+
+async def run_scenario(name: str, proxy_url: str, state: MockState, args, pid: int | None,
+                       start_n: int) -> dict:
+    scenario = SCENARIOS[name]
+    history = _history(args.history)
+    url = f"{proxy_url}/v1/messages"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results: list[dict] = []
+    errors = 0
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for n in range(start_n, start_n + args.requests):
+        queue.put_nowait(n)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # 워밍업 (커넥션/캐시) - 결과에서 제외
+        for i in range(min(args.warmup, args.concurrency)):
+            await _one_request(client, url, -1 - i, scenario, history)
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                n = queue.get_nowait()
+                try:
+                    result = await _one_request(client, url, n, scenario, history)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if result["status"] != 200:
+                    errors += 1
+                    continue
+                results.append(result)
+
+        cpu_before = _cpu_seconds(pid)
+        wall_started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - wall_started
+        cpu_after = _cpu_seconds(pid)
+
+    latency, overhead, ttft, ttft_overhead = [], [], [], []
+    for r in results:
+        total = (r["finished"] - r["started"]) * 1000
+        latency.append(total)
+        timing = state.timings.get(r["n"])
+        if timing and timing.finished:
+            overhead.append(total - (timing.finished - timing.received) * 1000)
+        if r["first_delta"]:
+            ttft.append((r["first_delta"] - r["started"]) * 1000)
+            if scenario["stream"] and timing and timing.first_delta:
+                ttft_overhead.append(
+                    (r["first_delta"] - r["started"]) * 1000
+                    - (timing.first_delta - timing.received) * 1000
+                )
+
+    completed = len(results)
+    cpu_ms = None
+    if cpu_before is not None and cpu_after is not None and completed:
+        cpu_ms = round((cpu_after - cpu_before) * 1000 / (completed + errors), 3)
+    return {
+        "requests": completed,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "requests_per_sec": round(completed / wall, 2) if wall else None,
+        "events_per_sec": round(sum(r["events"] for r in results) / wall, 1) if wall else None,
+        "latency_ms": _percentiles(latency),
+        "overhead_ms": _percentiles(overhead),
+        "ttft_ms": _percentiles(ttft),
+        "ttft_overhead_ms": _percentiles(ttft_overhead) if scenario["stream"] else None,
+        "cpu_ms_per_request": cpu_ms,
+    }
+
+
+def _fake_auth_home() -> str:
+    """만료되지 않은 가짜 토큰이 든 HOME (프록시가 토큰 갱신을 시도하지 않도록)"""
+    home = tempfile.mkdtemp(prefix="bench-home-")
+    os.makedirs(os.path.join(home, ".codex"))
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + 86400}).encode())
+    token = "h." + payload.decode().rstrip("=") + ".s"
+    with open(os.path.join(home, ".codex", "auth.json"), "w") as f:
+        json.dump({"tokens": {"access_token": token, "refresh_token": "bench",
+                              "account_id": "bench"}}, f)
+    return home
+
+
+def start_proxy(mock_port: int, port: int, extra_env: list[str], verbose: bool) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "HOME": _fake_auth_home(),
+        "CHATGPT_API_URL": f"http://127.0.0.1:{mock_port}/responses",
+        "PROXY_PORT": str(port),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "INFLIGHT_DEDUP": env.get("INFLIGHT_DEDUP", "false"),
+    })
+    for item in extra_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py")],
+        cwd=ROOT, env=env, stdout=output, stderr=output,
+    )
+
+
+async def wait_ready(url: str, proc: subprocess.Popen | None, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"proxy exited with code {proc.returncode}")
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"proxy not ready after {timeout:.0f}s")
+
+
+def _print_table(results: dict):
+    print(f"{'scenario':<14}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+          f"{'ovh p50':>9}{'ovh p99':>9}{'ttft p50':>10}{'ev/s':>10}{'cpu ms':>8}")
+    for name, r in results.items():
+        lat, ovh, ttft = r["latency_ms"], r["overhead_ms"], r["ttft_ms"]
+
+        def fmt(value, width=9):
+            return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+        print(f"{name:<14}{fmt(r['requests_per_sec'])}{fmt(lat['p50'])}{fmt(lat['p95'])}"
+              f"{fmt(lat['p99'])}{fmt(ovh['p50'])}{fmt(ovh['p99'])}{fmt(ttft['p50'], 10)}"
+              f"{fmt(r['events_per_sec'], 10)}{fmt(r['cpu_ms_per_request'], 8)}")
+
+
+def _compare(results: dict, baseline_path: str, threshold: float) -> int:
+    """이전 결과 대비 overhead p50/p99, CPU가 threshold 이상 나빠지면 1 반환"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    regressions = 0
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for label, now, before in (
+            ("overhead p50", r["overhead_ms"]["p50"], base["overhead_ms"]["p50"]),
+            ("overhead p99", r["overhead_ms"]["p99"], base["overhead_ms"]["p99"]),
+            ("cpu/request", r["cpu_ms_per_request"], base.get("cpu_ms_per_request")),
+        ):
+            if now is None or not before:
+                continue
+            change = (now - before) / before
+            mark = "  ⚠ regression" if change > threshold else ""
+            regressions += bool(mark)
+            print(f"{name:<14}{label:<14}{before:>9.2f} → {now:>9.2f} ({change:+.0%}){mark}")
+    return 1 if regressions else 0
+
+
+async def main_async(args) -> int:
+    import uvicorn
+
+    replay = load_replay(args.replay) if args.replay else None
+    state = MockState(MockConfig(args.tokens, args.token_rate, args.ttft_ms, replay))
+    mock_port = args.mock_port or _free_port()
+    mock = uvicorn.Server(uvicorn.Config(
+        create_app(state), host="127.0.0.1", port=mock_port, log_level="warning",
+    ))
+    mock_task = asyncio.create_task(mock.serve())
+    while not mock.started:
+        await asyncio.sleep(0.01)
+
+    proc = None
+    proxy_url = args.proxy_url
+    pid = args.proxy_pid
+    if proxy_url is None:
+        port = _free_port()
+        proc = start_proxy(mock_port, port, args.env, args.verbose)
+        proxy_url = f"http://127.0.0.1:{port}"
+        pid = proc.pid
+    try:
+        await wait_ready(proxy_url, proc)
+        results = {}
+        start_n = 0
+        for name in args.scenarios.split(","):
+            results[name] = await run_scenario(name, proxy_url, state, args, pid, start_n)
+            start_n += args.requests
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        mock.should_exit = True
+        await mock_task
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "scenarios": results,
+    }
+    _print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"→ {args.output}")
+    else:
+        print(json.dumps(report))
+    if args.compare:
+        return _compare(results, args.compare, args.threshold)
+    return 0
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help="쉼표 구분: " + ", ".join(SCENARIOS))
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200, help="시나리오별 요청 수")
+    ap.add_argument("--warmup", type=int, default=4)
+    ap.add_argument("--history", type=int, default=20, help="요청마다 반복되는 대화 턴 수")
+    ap.add_argument("--tokens", type=int, default=200, help="응답당 델타 수")
+    ap.add_argument("--token-rate", type=float, default=0.0, help="스트림당 초당 델타 수 (0=최대)")
+    ap.add_argument("--ttft-ms", type=float, default=0.0, help="모의 업스트림 첫 델타 지연 (ms)")
+    ap.add_argument("--replay", help="녹화된 Responses SSE 스트림 파일 (합성 스트림 대신 재생)")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--mock-port", type=int, default=0)
+    ap.add_argument("--proxy-url", help="이미 실행 중인 프록시 (CHATGPT_API_URL을 모의 서버로 지정해야 함)")
+    ap.add_argument("--proxy-pid", type=int, help="--proxy-url 사용 시 CPU 측정용 프로세스 id")
+    ap.add_argument("--env", action="append", default=[], help="프록시 환경변수 KEY=VALUE (반복 가능)")
+    ap.add_argument("--verbose", action="store_true", help="프록시 로그 출력")
+    ap.add_argument("--output", help="결과 JSON 파일 (없으면 stdout)")
+    ap.add_argument("--compare", help="비교할 이전 결과 JSON")
+    ap.add_argument("--threshold", type=float, default=0.15, help="회귀로 판단할 악화 비율")
+    args = ap.parse_args()
+    for name in args.scenarios.split(","):
+        if name not in SCENARIOS:
+            ap.error(f"unknown scenario: {name}")
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""SSE 파서 마이크로 벤치마크 - 초당 이벤트 처리량
+
+사용법:
+    python benchmarks/bench_sse.py                      # 합성 스트림 (텍스트 델타 20만 개)
+    python benchmarks/bench_sse.py --file capture.sse   # 녹화된 Responses SSE 스트림
+    python benchmarks/bench_sse.py --chunk 16384 --events 500000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse import SSEParser  # noqa: E402
+
+
+def synthetic_stream(n_events: int) -> bytes:
+    """텍스트 델타 위주의 Responses API 스트림 생성"""
+    parts = []
+    for i in range(n_events):
+        event = {
+            "type": "response.output_text.delta",
+            "item_id": "msg_0",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": "토큰 " if i % 7 == 0 else f"tok{i % 100} ",
+        }
+        parts.append(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n")
+    parts.append("data: [DONE]\n\n")
+    return "".join(parts).encode()
+
+
+def legacy_parse(chunks: list[bytes]) -> int:
+    """기존 방식: 문자열 누적 + split("\\n", 1) (비교용)"""
+    import codecs
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    count = 0
+    for chunk in chunks:
+        buffer += decoder.decode(chunk, False)
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            line = line.strip()
+            if line.startswith("data: ") and line[6:] != "[DONE]":
+                count += 1
+    return count
+
+
+def parser_parse(chunks: list[bytes]) -> int:
+    parser = SSEParser()
+    count = 0
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event.data != "[DONE]":
+                count += 1
+    for event in parser.flush():
+        if event.data != "[DONE]":
+            count += 1
+    return count
+
+
+def run(name: str, fn, chunks: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    rate = count / best
+    print(f"{name:>8}: {count} events in {best * 1000:.1f} ms → {rate:,.0f} events/s")
+    return rate
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", help="녹화된 SSE 스트림 파일")
+    ap.add_argument("--events", type=int, default=200_000, help="합성 이벤트 수")
+    ap.add_argument("--chunk", type=int, default=65536, help="청크 크기 (바이트)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            raw = f.read()
+    else:
+        raw = synthetic_stream(args.events)
+    chunks = [raw[i:i + args.chunk] for i in range(0, len(raw), args.chunk)]
+    print(f"stream: {len(raw) / 1e6:.1f} MB, {len(chunks)} chunks of {args.chunk} B")
+
+    legacy = run("legacy", legacy_parse, chunks, args.repeat)
+    parser = run("parser", parser_parse, chunks, args.repeat)
+    print(f" speedup: {parser / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
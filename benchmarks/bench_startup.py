@@ -0,0 +1,124 @@
+"""시작 시간 벤치마크 - server.py 실행부터 포트 수신(/health) / 준비 완료(/ready)까지
+
+모의 업스트림을 이 프로세스 안에서 띄우고 (사전 연결 대상) 프록시를 매번 새 프로세스로 실행한다.
+- import_ms: `import server` 시간 (새 인터프리터, 인터프리터 기동 제외)
+- listening_ms: 프로세스 시작 → /health 200
+- ready_ms: 프로세스 시작 → /ready 200 (토큰 로드 + 업스트림 사전 연결 완료)
+- 실행 스크립트의 고정 `sleep 2` 대비 절약 시간
+
+사용법:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --env LOG_LEVEL=DEBUG
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_proxy import ROOT, _fake_auth_home, _free_port, start_proxy  # noqa: E402
+from mock_upstream import MockConfig, MockState, create_app  # noqa: E402
+
+# start.sh / ccy 가 예전에 쓰던 고정 대기
+LEGACY_SLEEP_MS = 2000
+
+
+def measure_import(extra_env: list[str]) -> float:
+    env = dict(os.environ, HOME=_fake_auth_home(), LOG_LEVEL="WARNING")
+    for item in extra_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    code = "import time; t = time.perf_counter(); import server; print((time.perf_counter() - t) * 1000)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+async def measure_start(mock_port: int, extra_env: list[str], verbose: bool) -> tuple[float, float]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = start_proxy(mock_port, port, extra_env, verbose)
+    listening = None
+    try:
+        async with httpx.AsyncClient(timeout=1.0) as client:
+            while time.perf_counter() - started < 30:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"proxy exited with code {proc.returncode}")
+                try:
+                    if listening is None and (await client.get(f"{url}/health")).status_code == 200:
+                        listening = time.perf_counter() - started
+                    if (await client.get(f"{url}/ready")).status_code == 200:
+                        return listening * 1000, (time.perf_counter() - started) * 1000
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.01)
+        raise RuntimeError("proxy not ready after 30s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def _summary(values: list[float]) -> dict:
+    return {"min": round(min(values), 1), "median": round(statistics.median(values), 1),
+            "max": round(max(values), 1)}
+
+
+async def main_async(args):
+    import uvicorn
+
+    mock_port = _free_port()
+    mock = uvicorn.Server(uvicorn.Config(
+        create_app(MockState(MockConfig())), host="127.0.0.1", port=mock_port, log_level="warning",
+    ))
+    mock_task = asyncio.create_task(mock.serve())
+    while not mock.started:
+        await asyncio.sleep(0.01)
+
+    imports, listening, ready = [], [], []
+    try:
+        for _ in range(args.runs):
+            imports.append(await asyncio.to_thread(measure_import, args.env))
+            listen_ms, ready_ms = await measure_start(mock_port, args.env, args.verbose)
+            listening.append(listen_ms)
+            ready.append(ready_ms)
+    finally:
+        mock.should_exit = True
+        await mock_task
+
+    report = {
+        "runs": args.runs,
+        "import_ms": _summary(imports),
+        "listening_ms": _summary(listening),
+        "ready_ms": _summary(ready),
+        "saved_vs_sleep_ms": round(LEGACY_SLEEP_MS - statistics.median(ready), 1),
+    }
+    print(f"{'':>14}  {'min':>8}  {'median':>8}  {'max':>8}")
+    for key in ("import_ms", "listening_ms", "ready_ms"):
+        s = report[key]
+        print(f"{key:>14}  {s['min']:8.1f}  {s['median']:8.1f}  {s['max']:8.1f}")
+    print(f"ready vs fixed sleep {LEGACY_SLEEP_MS}ms: {report['saved_vs_sleep_ms']:+.0f}ms per session start")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"→ {args.output}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--env", action="append", default=[], help="프록시 환경변수 KEY=VALUE (반복 가능)")
+    ap.add_argument("--verbose", action="store_true", help="프록시 출력 표시")
+    ap.add_argument("--output", help="결과 JSON 파일")
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""ChatGPT Responses API 모의 서버 - CHATGPT_API_URL 대역 (벤치마크/부하 테스트용)
+
+요청마다 Responses SSE 스트림을 설정한 토큰 속도로 흘려보낸다.
+- 요청에 tools가 있으면 짧은 텍스트 + function_call, 없으면 텍스트만
+- --replay 로 녹화된 SSE 스트림을 델타 이벤트 단위로 속도를 맞춰 재생
+- 요청 본문의 "bench-req-<n>" 표식별로 수신/첫 델타/종료 시각(perf_counter)을 기록
+  → 같은 머신의 벤치마크 드라이버가 프록시가 더한 지연만 따로 계산할 수 있음
+
+사용법:
+    python benchmarks/mock_upstream.py --port 9100 --tokens 300 --token-rate 80
+    CHATGPT_API_URL=http://127.0.0.1:9100/responses python server.py
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass, field
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+_MARKER = re.compile(rb"bench-req-(\d+)")
+_DELTA_EVENTS = {"response.output_text.delta", "response.function_call_arguments.delta"}
+
+
+@dataclass
+class MockConfig:
+    tokens: int = 200                # 응답당 텍스트 델타 수
+    token_rate: float = 0.0          # 스트림당 초당 델타 수 (0이면 최대 속도)
+    ttft_ms: float = 0.0             # 첫 델타 전 대기 (업스트림 추론 지연 흉내)
+    replay: list[tuple[bytes, bool]] | None = None  # 녹화된 스트림의 (data, 델타 여부) 목록
+
+
+@dataclass
+class Timing:
+    received: float = 0.0
+    first_delta: float = 0.0
+    finished: float = 0.0
+
+
+@dataclass
+class MockState:
+    config: MockConfig
+    timings: dict[int, Timing] = field(default_factory=dict)
+    requests: int = 0
+
+
+def _frame(event: dict) -> bytes:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+
+
+def load_replay(path: str) -> list[tuple[bytes, bool]]:
+    """녹화된 SSE 파일 → (이벤트 data, 델타 이벤트 여부) 목록 ([DONE] 제외)"""
+    with open(path, "rb") as f:
+        raw = f.read().replace(b"\r\n", b"\n")
+    events = []
+    for block in raw.split(b"\n\n"):
+        data = [line[5:].lstrip() for line in block.split(b"\n") if line.startswith(b"data:")]
+        if not data or data[0] == b"[DONE]":
+            continue
+        payload = b"\n".join(data)
+        try:
+            is_delta = json.loads(payload).get("type") in _DELTA_EVENTS
+        except ValueError:
+            is_delta = False
+        events.append((payload, is_delta))
+    return events
+
+
+def synthetic_events(config: MockConfig, with_tools: bool) -> list[dict]:
+    """텍스트 델타 (+ function_call) Responses 이벤트 시퀀스"""
+    events: list[dict] = [{"type": "response.created", "response": {"id": "resp_mock"}}]
+    text_tokens = config.tokens if not with_tools else max(config.tokens // 10, 1)
+    for i in range(text_tokens):
+        events.append({
+            "type": "response.output_text.delta", "item_id": "msg_mock",
+            "output_index": 0, "content_index": 0,
+            "delta": "토큰 " if i % 7 == 0 else f"tok{i % 100} ",
+        })
+    events.append({"type": "response.output_text.done", "item_id": "msg_mock", "text": ""})
+    output = [{"type": "message"}]
+
+    if with_tools:
+        call = {"type": "function_call", "id": "fc_mock", "call_id": "call_mock",
+                "name": "Read", "arguments": ""}
+        events.append({"type": "response.output_item.added", "output_index": 1, "item": call})
+        path = "/".join(f"dir{i}" for i in range(max(config.tokens - text_tokens, 1)))
+        args = json.dumps({"file_path": f"/{path}/main.py"})
+        pieces = [args[i:i + 8] for i in range(0, len(args), 8)]
+        for piece in pieces:
+            events.append({"type": "response.function_call_arguments.delta",
+                           "item_id": "fc_mock", "output_index": 1, "delta": piece})
+        events.append({"type": "response.function_call_arguments.done",
+                       "item_id": "fc_mock", "arguments": args})
+        events.append({"type": "response.output_item.done", "output_index": 1,
+                       "item": {**call, "arguments": args}})
+        output.append({"type": "function_call"})
+
+    events.append({"type": "response.completed", "response": {
+        "id": "resp_mock", "output": output,
+        "usage": {"input_tokens": 1000, "output_tokens": config.tokens,
+                  "input_tokens_details": {"cached_tokens": 800}},
+    }})
+    return events
+
+
+def create_app(state: MockState) -> FastAPI:
+    app = FastAPI(title="Mock Responses API")
+
+    @app.post("/responses")
+    async def responses(request: Request):
+        received = time.perf_counter()
+        raw = await request.body()
+        state.requests += 1
+        match = _MARKER.search(raw)
+        timing = Timing(received=received)
+        if match:
+            state.timings[int(match.group(1))] = timing
+
+        config = state.config
+        if config.replay is not None:
+            frames = [(b"data: " + data + b"\n\n", is_delta) for data, is_delta in config.replay]
+        else:
+            with_tools = b'"tools"' in raw
+            frames = [(_frame(e), e["type"] in _DELTA_EVENTS)
+                      for e in synthetic_events(config, with_tools)]
+
+        async def stream():
+            interval = 1 / config.token_rate if config.token_rate > 0 else 0.0
+            if config.ttft_ms:
+                await asyncio.sleep(config.ttft_ms / 1000)
+            next_at = time.perf_counter()
+            for frame, is_delta in frames:
+                if is_delta:
+                    if interval:
+                        next_at += interval
+                        delay = next_at - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    if not timing.first_delta:
+                        timing.first_delta = time.perf_counter()
+                yield frame
+            yield b"data: [DONE]\n\n"
+            timing.finished = time.perf_counter()
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--tokens", type=int, default=200, help="응답당 델타 수")
+    ap.add_argument("--token-rate", type=float, default=0.0, help="스트림당 초당 델타 수 (0=최대)")
+    ap.add_argument("--ttft-ms", type=float, default=0.0, help="첫 델타 전 대기 (ms)")
+    ap.add_argument("--replay", help="녹화된 Responses SSE 스트림 파일")
+    args = ap.parse_args()
+
+    config = MockConfig(args.tokens, args.token_rate, args.ttft_ms,
+                        load_replay(args.replay) if args.replay else None)
+    uvicorn.run(create_app(MockState(config)), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""범용 LRU 캐시 - 항목 수/메모리 상한 + 히트/미스 카운터"""
+import hashlib
+from collections import OrderedDict
+from typing import Any
+
+import fastjson
+
+
+def canonical_json(obj: Any) -> bytes:
+    """키 정렬 + 공백 없는 JSON (같은 내용이면 항상 같은 바이트)"""
+    return fastjson.dumps(obj, sort_keys=True)
+
+
+def digest(data: bytes) -> str:
+    """캐시 키용 짧은 해시"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def stable_hash(obj: Any) -> str:
+    return digest(canonical_json(obj))
+
+
+def without_cache_control(content: Any) -> Any:
+    """키용: Anthropic 블록의 cache_control 제거 (Claude Code가 턴마다 마커 위치를 옮김)
+
+    tool_result 안쪽 블록까지 처리하고, 바뀐 블록만 새로 만든다 (문자열/변화 없으면 그대로 반환).
+    """
+    if not isinstance(content, list):
+        return content
+    result = None
+    for i, block in enumerate(content):
+        stripped = block
+        if isinstance(block, dict):
+            if "cache_control" in block:
+                stripped = {k: v for k, v in block.items() if k != "cache_control"}
+            inner = stripped.get("content")
+            if isinstance(inner, list):
+                inner_stripped = without_cache_control(inner)
+                if inner_stripped is not inner:
+                    stripped = {**stripped, "content": inner_stripped}
+        if result is None and stripped is not block:
+            result = content[:i]
+        if result is not None:
+            result.append(stripped)
+    return content if result is None else result
+
+
+class LRUCache:
+    """항목 수(max_entries)와 대략적인 크기 합(max_bytes) 상한을 가진 LRU 캐시
+
+    max_entries=0 이면 비활성 (항상 미스). max_bytes=0 이면 크기 제한 없음.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, value: Any, size: int = 0):
+        if self.max_entries <= 0:
+            return
+        if self.max_bytes and size > self.max_bytes:
+            return  # 단일 항목이 상한보다 크면 캐시하지 않음
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._data[key] = (value, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or (
+            self.max_bytes and self._bytes > self.max_bytes
+        ):
+            _, (_, evicted_size) = self._data.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self._bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
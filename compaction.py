@@ -0,0 +1,86 @@
+"""이전 턴 tool 결과 압축 - 오래된 function_call_output을 앞/뒤만 남기고 생략
+
+Claude Code는 매 턴 전체 대화를 재전송하므로 예전에 읽은 큰 파일/테스트 로그가 매 요청 다시 올라간다.
+- 가장 최근 TOOL_OUTPUT_KEEP_RECENT개 결과는 그대로 전달
+- 그 이전 결과는 TOOL_OUTPUT_MAX_CHARS를 넘으면 앞/뒤 절반씩만 남기고 가운데 생략 표시
+- 이전 결과 합계가 TOOL_OUTPUT_TOTAL_CHARS를 넘으면 (최신부터 채우고) 더 오래된 결과는 TOOL_OUTPUT_MIN_CHARS로
+
+결과는 출력 내용과 단계(그대로/상한/최소)로만 정해지고 대화가 길어져도 단계는 줄어들기만 하므로
+같은 결과가 턴마다 다르게 잘리지 않는다 → 업스트림 프롬프트 캐시 prefix 유지.
+"""
+import os
+
+from log import get_logger
+
+logger = get_logger("compaction")
+
+# 그대로 보낼 최근 tool 결과 수
+TOOL_OUTPUT_KEEP_RECENT = int(os.getenv("TOOL_OUTPUT_KEEP_RECENT", "4"))
+# 이전 tool 결과 하나의 최대 길이 (문자 수, 0이면 압축 안 함)
+TOOL_OUTPUT_MAX_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_CHARS", "20000"))
+# 요청 하나의 이전 tool 결과 합계 상한 (문자 수, 0이면 제한 없음)
+TOOL_OUTPUT_TOTAL_CHARS = int(os.getenv("TOOL_OUTPUT_TOTAL_CHARS", "200000"))
+# 합계 상한을 넘은 오래된 결과의 길이
+TOOL_OUTPUT_MIN_CHARS = int(os.getenv("TOOL_OUTPUT_MIN_CHARS", "2000"))
+
+_stats = {"requests": 0, "compacted": 0, "chars_saved": 0}
+
+
+def elide(text: str, limit: int) -> str:
+    """앞/뒤 limit/2자씩 (줄 경계 우선) 남기고 가운데를 생략 표시로 대체"""
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    head_end = text.rfind("\n", half // 2, half)
+    head_end = head_end + 1 if head_end != -1 else half
+    tail_start = text.find("\n", len(text) - half, len(text) - half // 2)
+    tail_start = tail_start + 1 if tail_start != -1 else len(text) - half
+    lines = text.count("\n", head_end, tail_start)
+    marker = f"\n[... {tail_start - head_end} chars ({lines} lines) omitted by proxy ...]\n"
+    if len(marker) >= tail_start - head_end:
+        return text
+    return text[:head_end] + marker + text[tail_start:]
+
+
+def compact_tool_outputs(items: list[dict]) -> tuple[list[dict], int]:
+    """오래된 function_call_output 압축 → (새 items, 줄어든 문자 수)
+
+    캐시된 item은 공유되므로 수정하지 않고 압축된 item만 새로 만든다.
+    """
+    if not TOOL_OUTPUT_MAX_CHARS:
+        return items, 0
+    outputs = [i for i, item in enumerate(items) if item.get("type") == "function_call_output"]
+    older = outputs[:-TOOL_OUTPUT_KEEP_RECENT] if TOOL_OUTPUT_KEEP_RECENT > 0 else outputs
+    if not older:
+        return items, 0
+
+    new_items = None
+    saved = compacted = total = 0
+    for i in reversed(older):
+        output = items[i].get("output", "")
+        # 합계는 최소 단계 적용 전 길이로 센다 → 대화가 길어져도 이전 결과의 단계가 되돌아가지 않음
+        total += min(len(output), TOOL_OUTPUT_MAX_CHARS)
+        limit = TOOL_OUTPUT_MAX_CHARS
+        if TOOL_OUTPUT_TOTAL_CHARS and total > TOOL_OUTPUT_TOTAL_CHARS:
+            limit = min(limit, TOOL_OUTPUT_MIN_CHARS)
+        compact = elide(output, limit)
+        if compact is output:
+            continue
+        if new_items is None:
+            new_items = list(items)
+        new_items[i] = {**items[i], "output": compact}
+        saved += len(output) - len(compact)
+        compacted += 1
+
+    if new_items is None:
+        return items, 0
+    _stats["requests"] += 1
+    _stats["compacted"] += compacted
+    _stats["chars_saved"] += saved
+    logger.info("✂️ Tool outputs: compacted %d of %d older results, saved %d chars",
+                compacted, len(older), saved)
+    return new_items, saved
+
+
+def compaction_stats() -> dict:
+    return dict(_stats)
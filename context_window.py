@@ -0,0 +1,181 @@
+"""Context window 관리 - 변환된 요청이 모델 context window를 넘으면 업스트림 전송 전에 줄이기
+
+넘지 않는 요청은 문자 수 상한 검사 한 번으로 끝난다 (토큰 수 ≤ 문자 수).
+넘으면 토큰을 추정하고 (tokens.count_input_item, 항목별 캐시) 순서대로 줄인다:
+1. 같은 <system-reminder> 블록이 반복되면 처음 것만 남김
+2. 가장 오래된 턴부터 생략 안내 메시지 하나로 대체 (function_call ↔ output 짝이 끊기지 않는 지점에서만 자름)
+
+자르는 지점은 대화 앞에서부터 CONTEXT_PRUNE_STEP 단위로만 움직이므로
+대화가 길어져도 매 턴 바뀌지 않는다 → 업스트림 프롬프트 캐시 prefix 유지.
+"""
+import os
+from dataclasses import dataclass
+
+import tokens
+from converter import tools_chars
+from log import get_logger
+from models import context_window
+
+logger = get_logger("context_window")
+
+CONTEXT_MANAGER = os.getenv("CONTEXT_MANAGER", "true").lower() == "true"
+# context window 중 요청에 쓸 비율 (토큰 추정 오차 여유)
+CONTEXT_HEADROOM = float(os.getenv("CONTEXT_HEADROOM", "0.9"))
+# 한 번에 잘라낼 오래된 대화 크기 (context window 대비 비율)
+CONTEXT_PRUNE_STEP = float(os.getenv("CONTEXT_PRUNE_STEP", "0.25"))
+
+_REMINDER_PREFIX = "<system-reminder>"
+
+_stats = {"checked": 0, "over_budget": 0, "reminders_removed": 0, "items_dropped": 0, "tokens_dropped": 0}
+
+
+@dataclass
+class FitReport:
+    budget: int
+    tokens_before: int
+    tokens_after: int
+    reminders_removed: int = 0
+    items_dropped: int = 0
+    tokens_dropped: int = 0
+
+
+def fit(resp_body: dict) -> FitReport | None:
+    """resp_body["input"]을 모델 context window에 맞게 줄임 (줄일 필요 없으면 None)
+
+    failover 때는 같은 body의 사본에 대상 모델로 다시 호출된다 (upstream prepare 훅).
+    """
+    if not CONTEXT_MANAGER:
+        return None
+    _stats["checked"] += 1
+    window = context_window(resp_body["model"])
+    budget = int(window * CONTEXT_HEADROOM)
+    items = resp_body["input"]
+    instructions = resp_body.get("instructions", "")
+    if _char_bound(items) + len(instructions) + tools_chars(resp_body.get("tools")) <= budget:
+        return None
+
+    fixed = tokens.count_preamble(instructions, resp_body.get("tools"))
+    counts = [tokens.count_input_item(item) for item in items]
+    before = fixed + sum(counts)
+    if before <= budget:
+        return None
+
+    _stats["over_budget"] += 1
+    report = FitReport(budget, before, before)
+
+    deduped, report.reminders_removed = _dedup_reminders(items)
+    if report.reminders_removed:
+        counts = [c if d is item else (tokens.count_input_item(d) if d else 0)
+                  for item, d, c in zip(items, deduped, counts)]
+    total = fixed + sum(counts)
+    if total > budget:
+        # 반복 reminder를 뺀 크기로 자를 지점을 정하고, 남은 부분에서 다시 중복 제거
+        # (처음 나온 reminder가 잘려 나가면 남은 쪽의 첫 reminder가 유지됨)
+        cut, note = _oldest_cut(items, counts, total - budget, int(window * CONTEXT_PRUNE_STEP))
+        if cut:
+            kept, report.reminders_removed = _dedup_reminders(items[cut:])
+            deduped = [note] + kept
+            report.items_dropped = cut
+            report.tokens_dropped = sum(counts[:cut])
+    items = [item for item in deduped if item]
+    total = fixed + sum(tokens.count_input_item(item) for item in items)
+    report.tokens_after = total
+    resp_body["input"] = items
+
+    _stats["reminders_removed"] += report.reminders_removed
+    _stats["items_dropped"] += report.items_dropped
+    _stats["tokens_dropped"] += report.tokens_dropped
+    log = logger.warning if total > budget else logger.info
+    log("📏 Context window %s: ~%d → ~%d tokens (budget %d) | reminders removed %d, items dropped %d",
+        resp_body["model"], before, total, budget, report.reminders_removed, report.items_dropped)
+    return report
+
+
+def _char_bound(items: list[dict]) -> int:
+    """토큰 수 상한 (텍스트 문자 수 + 이미지 최대치 + 항목 오버헤드)"""
+    total = 0
+    for item in items:
+        total += tokens.MESSAGE_OVERHEAD
+        itype = item.get("type")
+        if itype == "message":
+            for part in item.get("content", ()):
+                if part.get("type") == "input_image":
+                    total += tokens.IMAGE_MAX_TOKENS
+                else:
+                    total += len(part.get("text", ""))
+        elif itype == "function_call":
+            total += len(item.get("name", "")) + len(item.get("arguments", ""))
+        elif itype == "function_call_output":
+            total += len(item.get("output", ""))
+        else:
+            total += len(str(item))
+    return total
+
+
+def _dedup_reminders(items: list[dict]) -> tuple[list[dict | None], int]:
+    """같은 <system-reminder> 텍스트는 처음 나온 것만 남김 → (위치별 item, 빈 메시지는 None / 제거 수)
+
+    캐시된 item은 수정하지 않고 바뀐 메시지만 새로 만든다.
+    """
+    seen: set[str] = set()
+    removed = 0
+    result: list[dict | None] = []
+    for item in items:
+        if item.get("type") == "message":
+            content = item.get("content", ())
+            kept = []
+            for part in content:
+                text = part.get("text", "")
+                if part.get("type") == "input_text" and text.startswith(_REMINDER_PREFIX):
+                    if text in seen:
+                        continue
+                    seen.add(text)
+                kept.append(part)
+            if len(kept) != len(content):
+                removed += len(content) - len(kept)
+                item = {**item, "content": kept} if kept else None
+        result.append(item)
+    return result, removed
+
+
+def _oldest_cut(items: list[dict], counts: list[int], excess: int, step: int) -> tuple[int, dict | None]:
+    """오래된 턴을 잘라낼 위치와 그 자리에 넣을 안내 메시지 (자를 곳이 없으면 0, None)
+
+    자를 수 있는 지점: 앞쪽의 function_call이 모두 output을 받은 항목 경계 (user 메시지 앞 또는
+    끝난 call ↔ output 짝 뒤) → 프롬프트 하나로 시작한 긴 agent 루프도 자를 수 있다.
+    step 토큰 배수를 처음 넘는 지점만 쓰므로 대화가 길어져도 같은 지점에서 자른다.
+    마지막 지점 뒤 (현재 턴 / 마지막 tool 호출)는 항상 남긴다.
+    """
+    cuts = []
+    prefix = 0
+    open_calls: set[str] = set()
+    for i, item in enumerate(items):
+        itype = item.get("type")
+        if i and not open_calls and itype != "function_call_output":
+            cuts.append((i, prefix))
+        if itype == "function_call":
+            open_calls.add(item.get("call_id"))
+        elif itype == "function_call_output":
+            open_calls.discard(item.get("call_id"))
+        prefix += counts[i]
+    if not cuts:
+        return 0, None
+
+    step = max(step, 1)
+    # 안내 메시지 자리만큼 여유
+    target = -(-(excess + 64) // step) * step
+    cut, dropped_tokens = next(((i, p) for i, p in cuts if p >= target), cuts[-1])
+    note = {
+        "type": "message",
+        "role": "user",
+        "content": [{
+            "type": "input_text",
+            "text": f"[{cut} earlier conversation items (~{dropped_tokens} tokens) were omitted "
+                    f"by the proxy to fit the model context window]",
+        }],
+    }
+    return cut, note
+
+
+def context_stats() -> dict:
+    return dict(_stats)
@@ -1,12 +1,61 @@
 """Anthropic Messages API → ChatGPT Responses API 형식 변환"""
-import json
+import logging
 import uuid
 import os
 from models import map_model
+from cache import LRUCache, canonical_json, digest, without_cache_control
+import fastjson
+import images
+from log import get_logger
+
+logger = get_logger("converter")
 
 # 실제 모델 정보를 시스템 프롬프트에 표시할지 여부
 REVEAL_ACTUAL_MODEL = os.getenv("REVEAL_ACTUAL_MODEL", "false").lower() == "true"
 
+# 메시지 단위 변환 캐시 (Claude Code는 매 턴 전체 대화를 재전송)
+MESSAGE_CACHE_ENTRIES = int(os.getenv("MESSAGE_CACHE_ENTRIES", "4096"))
+MESSAGE_CACHE_MAX_MB = float(os.getenv("MESSAGE_CACHE_MAX_MB", "64"))
+
+_message_cache = LRUCache(
+    MESSAGE_CACHE_ENTRIES, int(MESSAGE_CACHE_MAX_MB * 1024 * 1024)
+)
+
+# instructions + tools 변환 캐시 (세션 내내 거의 동일)
+TOOLS_CACHE_ENTRIES = int(os.getenv("TOOLS_CACHE_ENTRIES", "64"))
+
+_preamble_cache = LRUCache(TOOLS_CACHE_ENTRIES)
+# 캐시된 tools 리스트 id → (리스트, JSON 길이): context window 검사가 매번 직렬화하지 않도록
+_tools_chars = LRUCache(TOOLS_CACHE_ENTRIES)
+
+# 도구가 있을 때 instructions 맨 앞에 붙는 도구 사용 지시
+TOOL_INSTRUCTIONS = (
+    "=== MANDATORY TOOL USAGE PROTOCOL - FOLLOW EXACTLY ===\n"
+    "\n"
+    "ABSOLUTE RULE: When ANY task requires action, you MUST call tools IMMEDIATELY.\n"
+    "- If asked to read → call Read tool FIRST, then respond\n"
+    "- If asked to search → call Grep/Glob tool FIRST, then respond\n"
+    "- If asked to run → call Bash tool FIRST, then respond\n"
+    "- If asked to edit → call Edit tool FIRST, then respond\n"
+    "- If asked to create → call Write tool FIRST, then respond\n"
+    "\n"
+    "FORBIDDEN BEHAVIOR:\n"
+    "❌ \"I will read the file\" WITHOUT calling Read\n"
+    "❌ \"Let me check\" WITHOUT calling Grep\n"
+    "❌ \"I can help you\" WITHOUT calling tools\n"
+    "❌ Explaining what you would do WITHOUT doing it\n"
+    "\n"
+    "REQUIRED BEHAVIOR:\n"
+    "✅ User: \"read config.json\" → You: [CALL Read tool immediately]\n"
+    "✅ User: \"find all .ts files\" → You: [CALL Glob tool immediately]\n"
+    "✅ User: \"check git status\" → You: [CALL Bash tool immediately]\n"
+    "\n"
+    "This is NOT optional. This is NOT a suggestion. This is MANDATORY.\n"
+    "Failure to call tools when needed = task failure.\n"
+    "\n"
+    "=== END MANDATORY PROTOCOL ===\n\n"
+)
+
 
 def anthropic_to_responses(body: dict) -> dict:
     """Anthropic Messages API 요청 → ChatGPT Responses API 요청 변환"""
@@ -15,9 +64,74 @@ def anthropic_to_responses(body: dict) -> dict:
     # 실제 사용되는 모델
     actual_model = map_model(body.get("model", ""))
 
+    # instructions + tools (같은 system/tools/model 조합이면 캐시 재사용)
+    instructions, converted_tools = _instructions_and_tools(
+        body.get("system"), body.get("tools"), actual_model
+    )
+
+    # 메시지 변환 (system은 input에 넣지 않고 instructions로 사용)
+    for msg in body.get("messages", []):
+        items = _convert_message_cached(msg)
+        input_items.extend(items)
+
+    # 요청당 이미지 용량 예산 (넘치면 오래된 이미지 축소/제외)
+    input_items = images.apply_budget(input_items)
+
+    result = {
+        "model": actual_model,
+        "input": input_items,
+        "stream": body.get("stream", False),
+        "store": False,
+    }
+
+    # Codex API는 instructions 필수 (일반 Responses API와 다름)
+    result["instructions"] = instructions
+
+    # tools 변환
+    if converted_tools:
+        result["tools"] = converted_tools
+        result["tool_choice"] = "auto"
+
+    # 전체 요청 body 로깅 (디버깅용 - 레벨이 꺼져 있으면 미리보기 작업 생략)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log_request_anatomy(result)
+
+    return result
+
+
+def _instructions_and_tools(
+    system, tools: list | None, actual_model: str
+) -> tuple[str, list[dict] | None]:
+    """(system, tools, model) 지문으로 instructions 문자열과 변환된 tools 배열 캐시
+
+    한 세션 동안 도구 목록과 system 프롬프트는 거의 바뀌지 않으므로 매 턴 재조립하지 않는다.
+    캐시된 tools 리스트는 여러 요청이 공유하므로 수정하면 안 됨.
+    """
+    data = canonical_json([system, tools, actual_model])
+    key = digest(data)
+    cached = _preamble_cache.get(key)
+    if cached is not None:
+        return cached
+
+    cached = (
+        _build_instructions(system, bool(tools), actual_model),
+        [_convert_tool(t) for t in tools] if tools else None,
+    )
+    _preamble_cache.put(key, cached, len(data))
+    if cached[1]:
+        _tools_chars.put(str(id(cached[1])), (cached[1], len(fastjson.dumps(cached[1]))))
+
+    if tools and logger.isEnabledFor(logging.DEBUG):
+        tool_names = [t.get("name", "unknown") for t in tools]
+        logger.debug("🔧 Converting %d tools: %s", len(tools), ", ".join(tool_names))
+        logger.debug("🔧 tool_choice set to: auto")
+    return cached
+
+
+def _build_instructions(system, has_tools: bool, actual_model: str) -> str:
+    """system 메시지 + 도구 사용 지시 + (선택) 실제 모델 정보 → instructions"""
     # system 메시지 구성
     system_content = ""
-    system = body.get("system")
     if system:
         if isinstance(system, list):
             system_content = " ".join(
@@ -27,34 +141,8 @@ def anthropic_to_responses(body: dict) -> dict:
             system_content = system
 
     # 도구가 있을 때 도구 사용 지시를 맨 앞에 추가 (가장 먼저 보도록)
-    if body.get("tools"):
-        tool_instructions = (
-            "=== MANDATORY TOOL USAGE PROTOCOL - FOLLOW EXACTLY ===\n"
-            "\n"
-            "ABSOLUTE RULE: When ANY task requires action, you MUST call tools IMMEDIATELY.\n"
-            "- If asked to read → call Read tool FIRST, then respond\n"
-            "- If asked to search → call Grep/Glob tool FIRST, then respond\n"
-            "- If asked to run → call Bash tool FIRST, then respond\n"
-            "- If asked to edit → call Edit tool FIRST, then respond\n"
-            "- If asked to create → call Write tool FIRST, then respond\n"
-            "\n"
-            "FORBIDDEN BEHAVIOR:\n"
-            "❌ \"I will read the file\" WITHOUT calling Read\n"
-            "❌ \"Let me check\" WITHOUT calling Grep\n"
-            "❌ \"I can help you\" WITHOUT calling tools\n"
-            "❌ Explaining what you would do WITHOUT doing it\n"
-            "\n"
-            "REQUIRED BEHAVIOR:\n"
-            "✅ User: \"read config.json\" → You: [CALL Read tool immediately]\n"
-            "✅ User: \"find all .ts files\" → You: [CALL Glob tool immediately]\n"
-            "✅ User: \"check git status\" → You: [CALL Bash tool immediately]\n"
-            "\n"
-            "This is NOT optional. This is NOT a suggestion. This is MANDATORY.\n"
-            "Failure to call tools when needed = task failure.\n"
-            "\n"
-            "=== END MANDATORY PROTOCOL ===\n\n"
-        )
-        system_content = tool_instructions + (system_content or "")
+    if has_tools:
+        system_content = TOOL_INSTRUCTIONS + (system_content or "")
 
     # 실제 모델 정보를 시스템 프롬프트에 추가 (도구 지시 다음에)
     if REVEAL_ACTUAL_MODEL:
@@ -64,52 +152,29 @@ def anthropic_to_responses(body: dict) -> dict:
         )
         system_content = model_identity + system_content if system_content else model_identity
 
-    # 메시지 변환 (system은 input에 넣지 않고 instructions로 사용)
-    for msg in body.get("messages", []):
-        items = _convert_message(msg)
-        input_items.extend(items)
-
-    result = {
-        "model": map_model(body.get("model", "")),
-        "input": input_items,
-        "stream": body.get("stream", False),
-        "store": False,
-    }
+    return system_content or "You are a helpful assistant."
 
-    # Codex API는 instructions 필수 (일반 Responses API와 다름)
-    result["instructions"] = system_content or "You are a helpful assistant."
 
-    # tools 변환
-    tools = body.get("tools")
-    if tools:
-        result["tools"] = [_convert_tool(t) for t in tools]
-        result["tool_choice"] = "auto"
-
-        # 도구 변환 로깅
-        tool_names = [t.get("name", "unknown") for t in tools]
-        print(f"[converter] 🔧 Converting {len(tools)} tools: {', '.join(tool_names)}")
-        print(f"[converter] 🔧 tool_choice set to: auto")
-        print(f"[converter] 🔧 instructions required by Codex API (not in input)")
-
-    # 전체 요청 body 로깅 (디버깅용)
-    print("\n[converter] 📋 FULL REQUEST BODY:")
-    print(f"[converter]   model: {result['model']}")
-    print(f"[converter]   stream: {result['stream']}")
-    print(f"[converter]   instructions length: {len(result.get('instructions', ''))} chars")
+def _log_request_anatomy(result: dict):
+    """변환된 요청 구조 상세 출력 (DEBUG)"""
+    lines = ["📋 FULL REQUEST BODY:"]
+    lines.append(f"  model: {result['model']}")
+    lines.append(f"  stream: {result['stream']}")
+    lines.append(f"  instructions length: {len(result.get('instructions', ''))} chars")
     if result.get("instructions"):
         # instructions 앞뒤 200자만 표시
         inst = result["instructions"]
         if len(inst) > 400:
-            print(f"[converter]   instructions preview: {inst[:200]}...{inst[-200:]}")
+            lines.append(f"  instructions preview: {inst[:200]}...{inst[-200:]}")
         else:
-            print(f"[converter]   instructions: {inst}")
-    print(f"[converter]   input items: {len(result['input'])} items")
+            lines.append(f"  instructions: {inst}")
+    lines.append(f"  input items: {len(result['input'])} items")
 
     # 실제 user message 찾기 및 출력
     actual_user_message = None
     for i, item in enumerate(result['input']):
         item_type = item.get('type', 'unknown')
-        print(f"[converter]     [{i}] type: {item_type}, role: {item.get('role', 'N/A')}")
+        lines.append(f"    [{i}] type: {item_type}, role: {item.get('role', 'N/A')}")
         if item_type == "message":
             content = item.get('content', [])
             for c in content:
@@ -117,23 +182,82 @@ def anthropic_to_responses(body: dict) -> dict:
                 if c_type in ['input_text', 'output_text']:
                     text = c.get('text', '')
                     preview = text[:100] if len(text) > 100 else text
-                    print(f"[converter]         {c_type}: {preview}...")
+                    lines.append(f"        {c_type}: {preview}...")
                     # system-reminder가 아닌 실제 메시지 찾기
                     if c_type == 'input_text' and not text.startswith('<system-reminder>') and not text.startswith('<command-'):
                         if actual_user_message is None or len(text) > len(actual_user_message):
                             actual_user_message = text
 
     if actual_user_message:
-        print(f"\n[converter] 💬 ACTUAL USER MESSAGE:")
-        print(f"[converter]   {actual_user_message[:300]}")
-        print()
+        lines.append("💬 ACTUAL USER MESSAGE:")
+        lines.append(f"  {actual_user_message[:300]}")
 
     if result.get("tools"):
-        print(f"[converter]   tools: {len(result['tools'])} tools defined")
-        print(f"[converter]   tool_choice: {result.get('tool_choice', 'N/A')}")
-    print("[converter] 📋 END REQUEST BODY\n")
+        lines.append(f"  tools: {len(result['tools'])} tools defined")
+        lines.append(f"  tool_choice: {result.get('tool_choice', 'N/A')}")
+    lines.append("📋 END REQUEST BODY")
+    logger.debug("\n".join(lines))
 
-    return result
+
+def _convert_message_cached(msg: dict) -> list[dict]:
+    """메시지 내용 해시로 변환 결과 재사용 (새 메시지만 실제 변환)
+
+    캐시된 item dict는 여러 요청이 공유하므로 이후 단계에서 수정하면 안 됨.
+    """
+    data = canonical_json(_key_source(msg))
+    key = digest(data)
+    items = _message_cache.get(key)
+    if items is None:
+        items = _convert_message(msg)
+        # 캐시된 item이 data URI를 계속 참조하므로 이미지 용량도 항목 크기에 포함
+        _message_cache.put(key, items, len(data) + _image_bytes(msg))
+    return items
+
+
+def _image_bytes(msg: dict) -> int:
+    """메시지 안 base64 이미지 본문 길이 합"""
+    content = msg.get("content")
+    if not isinstance(content, list):
+        return 0
+    return sum(
+        len(b.get("source", {}).get("data", ""))
+        for b in content
+        if isinstance(b, dict) and b.get("type") == "image"
+    )
+
+
+def _key_source(msg: dict) -> dict:
+    """캐시 키용: cache_control 제거 (변환 결과와 무관) + base64 이미지 본문을 내용 해시로 대체"""
+    content = without_cache_control(msg.get("content"))
+    if isinstance(content, list) and any(
+        b.get("type") == "image" for b in content if isinstance(b, dict)
+    ):
+        content = [
+            {"type": "image", "digest": images.image_key(b.get("source", {}))}
+            if isinstance(b, dict) and b.get("type") == "image" else b
+            for b in content
+        ]
+    return msg if content is msg.get("content") else {**msg, "content": content}
+
+
+def tools_chars(tools: list | None) -> int:
+    """변환된 tools의 JSON 길이 (캐시에서 나온 리스트면 변환 시 잰 값 재사용)"""
+    if not tools:
+        return 0
+    entry = _tools_chars.get(str(id(tools)))
+    if entry is not None and entry[0] is tools:
+        return entry[1]
+    return len(fastjson.dumps(tools))
+
+
+def message_cache_stats() -> dict:
+    """메시지 변환 캐시 통계 (hits/misses/evictions)"""
+    return _message_cache.stats()
+
+
+def tools_cache_stats() -> dict:
+    """instructions + tools 캐시 통계"""
+    return _preamble_cache.stats()
 
 
 def _convert_message(msg: dict) -> list[dict]:
@@ -173,7 +297,7 @@ def _convert_message(msg: dict) -> list[dict]:
                 "id": block.get("id", f"call_{uuid.uuid4().hex[:24]}"),
                 "call_id": block.get("id", f"call_{uuid.uuid4().hex[:24]}"),
                 "name": block.get("name", ""),
-                "arguments": json.dumps(block.get("input", {})),
+                "arguments": fastjson.dumps_str(block.get("input", {})),
             })
 
         elif btype == "tool_result":
@@ -193,16 +317,10 @@ def _convert_message(msg: dict) -> list[dict]:
             })
 
         elif btype == "image":
-            source = block.get("source", {})
-            if source.get("type") == "base64":
-                data_uri = (
-                    f"data:{source.get('media_type', 'image/png')};"
-                    f"base64,{source.get('data', '')}"
-                )
-                content_parts.append({
-                    "type": "input_image",
-                    "image_url": data_uri,
-                })
+            # 같은 이미지는 data URI를 한 번만 만들어 공유
+            part = images.image_part(block.get("source", {}))
+            if part is not None:
+                content_parts.append(part)
 
         elif btype == "thinking":
             pass  # thinking 블록 무시
@@ -227,11 +345,10 @@ def _convert_tool(tool: dict) -> dict:
         "parameters": tool.get("input_schema", {"type": "object"}),
     }
 
-    # 도구별 상세 로깅 (첫 3개만)
-    name = converted["name"]
-    if name:
+    # 도구별 상세 로깅
+    if logger.isEnabledFor(logging.DEBUG) and converted["name"]:
         param_count = len(converted["parameters"].get("properties", {}))
-        print(f"[converter]    • {name}: {param_count} parameters")
+        logger.debug("   • %s: %d parameters", converted["name"], param_count)
 
     return converted
 
@@ -249,8 +366,8 @@ def responses_to_anthropic(resp_data: dict, model: str) -> dict:
                     content.append({"type": "text", "text": c.get("text", "")})
         elif item_type == "function_call":
             try:
-                args = json.loads(item.get("arguments", "{}"))
-            except json.JSONDecodeError:
+                args = fastjson.loads(item.get("arguments") or "{}")
+            except ValueError:
                 args = {}
             content.append({
                 "type": "tool_use",
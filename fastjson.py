@@ -0,0 +1,46 @@
+"""JSON 직렬화/파싱 - orjson이 설치되어 있으면 사용 (없으면 표준 json)
+
+요청 본문 파싱, 업스트림 요청 본문, SSE 이벤트, 캐시 키가 모두 이 모듈을 거친다.
+- dumps: 공백 없는 UTF-8 bytes (표준 json 경로도 ensure_ascii=False로 같은 결과)
+- loads: bytes/str 파싱, orjson이 거부하는 입력(lone surrogate, NaN 등)은 표준 json으로 재시도
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError도 이 클래스의 하위 클래스
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj, sort_keys: bool = False) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            pass  # lone surrogate, 문자열이 아닌 키, 64비트 초과 정수 등
+    text = json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, separators=(",", ":"))
+    try:
+        return text.encode()
+    except UnicodeEncodeError:
+        # lone surrogate → \\u 이스케이프로 (유효한 UTF-8 유지)
+        return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":")).encode()
+
+
+def dumps_str(obj) -> str:
+    return dumps(obj).decode()
+
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # 진짜 잘못된 JSON이면 아래에서 다시 예외
+    return json.loads(data)
+
+
+def backend() -> str:
+    return "orjson" if orjson is not None else "json"
@@ -0,0 +1,155 @@
+"""이미지 블록 처리 - 내용 해시로 data URI를 한 번만 만들어 재사용 + 요청당 이미지 용량 예산
+
+Claude Code는 매 턴 전체 대화를 재전송하므로 스크린샷이 몇 장만 있어도 매 요청 수 MB가 올라간다.
+- 같은 이미지(media_type + base64 내용)는 input_image part 하나를 모든 메시지/요청이 공유
+- IMAGE_BUDGET_MB를 넘는 요청은 최신 이미지부터 예산을 채우고, 나머지 오래된 이미지는
+  Pillow가 있으면 축소본으로, 없거나 축소해도 넘치면 텍스트 안내로 대체 (가장 최근 이미지는 항상 유지)
+"""
+import base64
+import io
+import os
+
+from cache import LRUCache, digest
+from log import get_logger
+
+logger = get_logger("images")
+
+# data URI 캐시 (내용 해시 → input_image part)
+IMAGE_CACHE_ENTRIES = int(os.getenv("IMAGE_CACHE_ENTRIES", "256"))
+IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "128"))
+# 요청 하나에 실을 이미지 data URI 총량 (MB, 0이면 제한 없음)
+IMAGE_BUDGET_MB = float(os.getenv("IMAGE_BUDGET_MB", "20"))
+# 예산 초과 시 오래된 이미지 축소 크기 (긴 변 픽셀, Pillow 필요, 0이면 축소 없이 제외)
+IMAGE_DOWNSCALE_PX = int(os.getenv("IMAGE_DOWNSCALE_PX", "768"))
+
+_BUDGET_BYTES = int(IMAGE_BUDGET_MB * 1024 * 1024)
+
+_parts = LRUCache(IMAGE_CACHE_ENTRIES, int(IMAGE_CACHE_MAX_MB * 1024 * 1024))
+# 원본 data URI 해시 → 축소본 part (축소 실패/효과 없음이면 False)
+_downscaled = LRUCache(IMAGE_CACHE_ENTRIES)
+
+_stats = {"downscaled": 0, "dropped": 0, "bytes_saved": 0}
+_pil = None
+
+
+def _get_pil():
+    """PIL.Image 모듈 (미설치 시 False → 축소 대신 제외)"""
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image
+            _pil = Image
+        except ImportError:
+            logger.info("Pillow 미설치 → 예산 초과 이미지는 축소 없이 제외")
+            _pil = False
+    return _pil
+
+
+def image_key(source: dict) -> str:
+    """이미지 내용 해시 (같은 스크린샷이면 어느 메시지에 있든 같은 키)"""
+    data = source.get("data", "")
+    return digest(f"{source.get('media_type', '')}:".encode() + data.encode())
+
+
+def image_part(source: dict) -> dict | None:
+    """Anthropic image source → input_image part (캐시된 dict는 공유되므로 수정 금지)"""
+    stype = source.get("type")
+    if stype == "url":
+        return {"type": "input_image", "image_url": source.get("url", "")}
+    if stype != "base64":
+        return None
+
+    key = image_key(source)
+    part = _parts.get(key)
+    if part is None:
+        data_uri = f"data:{source.get('media_type', 'image/png')};base64,{source.get('data', '')}"
+        part = {"type": "input_image", "image_url": data_uri}
+        _parts.put(key, part, len(data_uri))
+    return part
+
+
+def apply_budget(items: list[dict]) -> list[dict]:
+    """요청 input의 이미지 총량을 IMAGE_BUDGET_MB 이하로 (예산 안이면 items 그대로 반환)
+
+    최신 메시지부터 예산을 채우고 넘치는 오래된 이미지는 축소본/텍스트로 바꾼다.
+    캐시된 item은 수정하지 않고 바뀐 message item만 새로 만든다.
+    """
+    if not _BUDGET_BYTES:
+        return items
+    images = [
+        (i, j, len(part["image_url"]))
+        for i, item in enumerate(items) if item.get("type") == "message"
+        for j, part in enumerate(item.get("content", ())) if part.get("type") == "input_image"
+    ]
+    total = sum(size for _, _, size in images)
+    if total <= _BUDGET_BYTES:
+        return items
+
+    used = 0
+    replaced: dict[int, list[dict]] = {}
+    downscaled = dropped = 0
+    for n, (i, j, size) in enumerate(reversed(images)):
+        if n == 0 or used + size <= _BUDGET_BYTES:
+            used += size
+            continue
+        part = items[i]["content"][j]
+        small = _downscale(part["image_url"])
+        if small is not None and used + len(small["image_url"]) <= _BUDGET_BYTES:
+            new_part = small
+            downscaled += 1
+        else:
+            new_part = {"type": "input_text",
+                        "text": f"[image omitted: {size / 1048576:.1f} MB over the request image budget]"}
+            dropped += 1
+        used += len(new_part.get("image_url", ""))
+        replaced.setdefault(i, list(items[i]["content"]))[j] = new_part
+
+    items = list(items)
+    for i, content in replaced.items():
+        items[i] = {**items[i], "content": content}
+
+    _stats["downscaled"] += downscaled
+    _stats["dropped"] += dropped
+    _stats["bytes_saved"] += total - used
+    logger.info("🖼 Image budget: %d images %.1fMB → %.1fMB (downscaled %d, dropped %d)",
+                len(images), total / 1048576, used / 1048576, downscaled, dropped)
+    return items
+
+
+def _downscale(data_uri: str) -> dict | None:
+    """data URI 이미지를 IMAGE_DOWNSCALE_PX 이하로 축소 (Pillow 없음/실패/효과 없음이면 None)"""
+    pil = _get_pil() if IMAGE_DOWNSCALE_PX else False
+    if not pil:
+        return None
+    key = digest(data_uri.encode())
+    cached = _downscaled.get(key)
+    if cached is not None:
+        return cached or None
+
+    small = None
+    try:
+        raw = base64.b64decode(data_uri.partition(",")[2])
+        with pil.open(io.BytesIO(raw)) as img:
+            img.thumbnail((IMAGE_DOWNSCALE_PX, IMAGE_DOWNSCALE_PX))
+            out = io.BytesIO()
+            if img.mode in ("RGBA", "LA", "P"):
+                img.save(out, "PNG", optimize=True)
+                media_type = "image/png"
+            else:
+                img.convert("RGB").save(out, "JPEG", quality=80)
+                media_type = "image/jpeg"
+        encoded = base64.b64encode(out.getvalue()).decode()
+        if len(encoded) < len(raw) * 4 // 3:
+            small = {"type": "input_image", "image_url": f"data:{media_type};base64,{encoded}"}
+    except Exception as e:
+        logger.debug("이미지 축소 실패: %s", e)
+    _downscaled.put(key, small or False)
+    return small
+
+
+def image_stats() -> dict:
+    stats = _parts.stats()
+    stats.update(_stats)
+    stats["budget_mb"] = IMAGE_BUDGET_MB
+    stats["downscale"] = bool(IMAGE_DOWNSCALE_PX and _get_pil())
+    return stats
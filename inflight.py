@@ -0,0 +1,143 @@
+"""동일 요청 single-flight - 동시에 들어온 같은 요청은 업스트림 호출 하나를 공유
+
+병렬 subagent 등이 같은 요청을 동시에 보내면 첫 요청(leader)만 업스트림에 연결하고,
+나머지는 그 이벤트 스트림을 처음부터 같이 받는다. 변환은 클라이언트마다 자기 리듀서로
+하므로 msg id 등은 클라이언트별로 따로 생성된다.
+
+업스트림 소비는 별도 태스크에서 돌기 때문에 leader 클라이언트가 끊겨도 나머지는 계속
+받고, 구독자가 모두 떠나면 그때 업스트림 연결을 취소한다.
+"""
+import asyncio
+import os
+import weakref
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable
+
+from log import get_logger
+
+logger = get_logger("inflight")
+
+INFLIGHT_DEDUP = os.getenv("INFLIGHT_DEDUP", "true").lower() == "true"
+
+Opener = Callable[[], Awaitable[AsyncIterator[dict]]]
+
+# 진행 중인 업스트림 호출 (요청 key → flight)
+_flights: dict[str, "_Flight"] = {}
+_stats = {"flights": 0, "joined": 0, "cancelled": 0}
+
+
+class _Flight:
+    """업스트림 이벤트 스트림 하나를 여러 구독자에게 전달"""
+
+    def __init__(self, key: str, opener: Opener):
+        self.key = key
+        self.events: list[dict] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(opener))
+
+    async def _run(self, opener: Opener):
+        try:
+            async with aclosing(await opener()) as events:
+                async for event in events:
+                    self.events.append(event)
+                    self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            if _flights.get(self.key) is self:
+                del _flights[self.key]
+
+    def _notify(self):
+        # 대기 중인 구독자를 모두 깨우고 다음 이벤트용으로 교체
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def first(self):
+        """첫 이벤트(또는 종료)까지 대기 - 연결 오류는 여기서 구독자마다 예외로 전달"""
+        while not self.events and not self.done:
+            await self._changed.wait()
+        if not self.events and self.error is not None:
+            raise self.error
+
+    async def iterate(self, sub: "_Subscription") -> AsyncIterator[dict]:
+        index = 0
+        try:
+            while True:
+                if index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            sub.leave()
+
+    def leave(self):
+        self.subscribers -= 1
+        if self.subscribers <= 0 and not self.done:
+            # 남은 구독자 없음 → 업스트림 연결 취소
+            _stats["cancelled"] += 1
+            if _flights.get(self.key) is self:
+                del _flights[self.key]
+            self._task.cancel()
+
+
+class _Subscription:
+    """구독 하나 (leave는 한 번만 적용)"""
+
+    __slots__ = ("flight", "left", "__weakref__")
+
+    def __init__(self, flight: _Flight):
+        self.flight = flight
+        self.left = False
+
+    def leave(self):
+        if not self.left:
+            self.left = True
+            self.flight.leave()
+
+
+async def open_shared(key: str | None, opener: Opener) -> tuple[AsyncIterator[dict], bool]:
+    """opener로 여는 이벤트 스트림을 같은 key의 동시 요청끼리 공유
+
+    반환: (이벤트 스트림, 다른 요청의 업스트림 호출에 합류했는지 여부)
+    """
+    if key is None or not INFLIGHT_DEDUP:
+        return await opener(), False
+
+    flight = _flights.get(key)
+    joined = flight is not None
+    if flight is None:
+        flight = _Flight(key, opener)
+        _flights[key] = flight
+        _stats["flights"] += 1
+    else:
+        _stats["joined"] += 1
+        logger.info("🔗 In-flight request joined | %s | subscribers: %d",
+                    key[:12], flight.subscribers + 1)
+
+    flight.subscribers += 1
+    sub = _Subscription(flight)
+    try:
+        await flight.first()
+    except BaseException:
+        sub.leave()
+        raise
+    stream = flight.iterate(sub)
+    # 스트림이 한 번도 소비되지 않고 버려져도 (응답 시작 전 클라이언트 끊김) 구독 해제
+    weakref.finalize(stream, sub.leave)
+    return stream, joined
+
+
+def inflight_stats() -> dict:
+    stats = dict(_stats)
+    stats["active"] = len(_flights)
+    return stats
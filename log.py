@@ -0,0 +1,82 @@
+"""로깅 설정 - 레벨 + 비동기 큐 핸들러 + (선택) JSON lines 출력
+
+핫패스에서는 `logger.isEnabledFor(logging.DEBUG)`로 감싸서
+미리보기/json.dumps 같은 비싼 작업을 레벨이 꺼져 있으면 아예 하지 않는다.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text: "[converter] ..." 형식 / json: 한 줄에 하나의 JSON 객체
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+ROOT_LOGGER = "proxy"
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class TextFormatter(logging.Formatter):
+    """기존 print 출력과 같은 "[모듈] 메시지" 형식"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        tag = record.name.rsplit(".", 1)[-1]
+        line = f"[{tag}] {record.getMessage()}"
+        if record.levelno >= logging.WARNING:
+            line = f"[{tag}] {record.levelname}: {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """JSON lines 형식 (로그 수집기용)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup():
+    """루트 로거에 큐 핸들러 연결 (실제 stdout 쓰기는 별도 스레드에서)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonLinesFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """모듈별 로거 ("proxy.<name>")"""
+    setup()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,269 @@
+"""Prometheus 메트릭 - /metrics 텍스트 포맷 (외부 의존성 없음)
+
+모든 요청 메트릭은 (original_model, mapped_model) 레이블을 가진다.
+관측은 dict 갱신 + bisect 한 번이라 스트리밍 경로에 부담이 거의 없고,
+이벤트당 처리는 첫 토큰/완료 이벤트 확인 정도만 한다.
+
+멀티 워커(METRICS_DIR 설정)에서는 워커마다 METRICS_FLUSH_INTERVAL초마다 자기 값을
+METRICS_DIR/metrics-<pid>.json에 쓰고, /metrics는 모든 워커 파일을 합산해서 보여준다.
+"""
+import asyncio
+import glob
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import aclosing
+from contextvars import ContextVar
+from typing import AsyncIterator
+
+import fastjson
+
+# 워커 간 메트릭 공유 디렉토리 (비어 있으면 프로세스 메모리만 사용, 멀티 워커 실행 시 자동 설정)
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+MODEL_LABELS = ("original_model", "mapped_model")
+
+# 현재 요청의 (original_model, mapped_model) - 업스트림 모듈 등 깊은 곳에서 레이블용으로 사용
+current_labels: ContextVar[tuple[str, str]] = ContextVar("current_labels", default=("", ""))
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = MODEL_LABELS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, labels: tuple, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    @staticmethod
+    def merge(total: dict, values: dict):
+        for labels, value in values.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in (self._values if values is None else values).items():
+            lines.append(f"{self.name}{_label_str(self.labelnames, labels)} {_format(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...] = _LATENCY_BUCKETS,
+        labelnames: tuple[str, ...] = MODEL_LABELS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # 레이블별 [버킷별 개수 (마지막은 +Inf)..., 합계, 개수]
+        self._values: dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, labels: tuple, value: float):
+        data = self._values.get(labels)
+        if data is None:
+            data = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    @staticmethod
+    def merge(total: dict, values: dict):
+        for labels, data in values.items():
+            current = total.get(labels)
+            total[labels] = list(data) if current is None else [a + b for a, b in zip(current, data)]
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, data in (self._values if values is None else values).items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data):
+                cumulative += count
+                le = 'le="%s"' % _format(float(bound))
+                lines.append(
+                    f"{self.name}_bucket{_label_str(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_str = _label_str(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format(data[-2])}")
+            lines.append(f"{self.name}_count{label_str} {data[-1]}")
+        return lines
+
+
+_registry: list = []
+
+REQUESTS = Counter(
+    "proxy_requests_total", "Requests by response status",
+    MODEL_LABELS + ("status",),
+)
+RESPONSE_CACHE_HITS = Counter("proxy_response_cache_hits_total", "Requests served from the response cache")
+UPSTREAM_ERRORS = Counter(
+    "proxy_upstream_errors_total", "Failed upstream attempts (including retried ones) by status/reason",
+    MODEL_LABELS + ("reason",),
+)
+TOOL_CALLS = Counter("proxy_tool_calls_total", "function_call items returned by the upstream")
+TOOL_OUTPUT_CHARS_SAVED = Counter(
+    "proxy_tool_output_chars_saved_total", "Characters removed from older tool outputs by compaction",
+)
+CONTEXT_PRUNED = Counter(
+    "proxy_context_pruned_requests_total", "Requests shortened to fit the model context window",
+)
+TOKENS = Counter(
+    "proxy_tokens_total", "Upstream token usage (type: input, output, cached)",
+    MODEL_LABELS + ("type",),
+)
+
+CONVERSION_SECONDS = Histogram(
+    "proxy_conversion_seconds", "anthropic_to_responses conversion time",
+    (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+UPSTREAM_CONNECT_SECONDS = Histogram(
+    "proxy_upstream_connect_seconds", "Time until upstream response headers (per attempt)",
+)
+TTFT_SECONDS = Histogram(
+    "proxy_time_to_first_token_seconds", "Request start to first text/tool delta",
+)
+DURATION_SECONDS = Histogram(
+    "proxy_request_duration_seconds", "Request start to end of upstream stream",
+)
+OUTPUT_TOKENS_PER_SECOND = Histogram(
+    "proxy_output_tokens_per_second", "Output tokens / (completion time - first token time)",
+    _RATE_BUCKETS,
+)
+
+_DELTA_EVENTS = frozenset(("response.output_text.delta", "response.function_call_arguments.delta"))
+
+
+async def track(
+    events: AsyncIterator[dict], labels: tuple[str, str], started: float, usage: bool = True
+) -> AsyncIterator[dict]:
+    """이벤트 스트림을 그대로 전달하면서 TTFT / 처리 시간 / 토큰 사용량 기록
+
+    usage=False 이면 토큰/tool call 집계 생략 (다른 요청의 업스트림 호출에 합류한 경우)
+    """
+    first_token = 0.0
+    try:
+        async with aclosing(events):
+            async for event in events:
+                etype = event.get("type")
+                if not first_token and (
+                    etype in _DELTA_EVENTS
+                    or (etype == "response.output_item.done"
+                        and event.get("item", {}).get("type") == "function_call")
+                ):
+                    first_token = time.perf_counter()
+                    TTFT_SECONDS.observe(labels, first_token - started)
+                elif etype == "response.completed" and usage:
+                    _record_completion(event.get("response", {}), labels, first_token)
+                yield event
+    finally:
+        DURATION_SECONDS.observe(labels, time.perf_counter() - started)
+
+
+def _record_completion(resp: dict, labels: tuple[str, str], first_token: float):
+    usage = resp.get("usage", {})
+    output_tokens = usage.get("output_tokens", 0)
+    TOKENS.inc(labels + ("input",), usage.get("input_tokens", 0))
+    TOKENS.inc(labels + ("output",), output_tokens)
+    TOKENS.inc(labels + ("cached",), (usage.get("input_tokens_details") or {}).get("cached_tokens", 0))
+    tool_calls = sum(1 for item in resp.get("output", []) if item.get("type") == "function_call")
+    if tool_calls:
+        TOOL_CALLS.inc(labels, tool_calls)
+    if first_token:
+        elapsed = time.perf_counter() - first_token
+        if elapsed > 0 and output_tokens:
+            OUTPUT_TOKENS_PER_SECOND.observe(labels, output_tokens / elapsed)
+
+
+def render() -> str:
+    lines: list[str] = []
+    if not METRICS_DIR:
+        for metric in _registry:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    # 멀티 워커: 자기 값을 먼저 쓰고 모든 워커 파일 합산
+    write_snapshot()
+    merged: dict[str, dict] = {metric.name: {} for metric in _registry}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            with open(path, "rb") as f:
+                snapshot = fastjson.loads(f.read())
+        except (OSError, ValueError):
+            continue
+        for metric in _registry:
+            values = {tuple(labels): value for labels, value in snapshot.get(metric.name, ())}
+            metric.merge(merged[metric.name], values)
+    for metric in _registry:
+        lines.extend(metric.render(merged[metric.name]))
+    return "\n".join(lines) + "\n"
+
+
+def clear_snapshots(directory: str):
+    """이전 실행의 워커 스냅샷 삭제 (워커 시작 전에 호출)"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def write_snapshot():
+    """이 워커의 메트릭 값을 METRICS_DIR/metrics-<pid>.json에 기록 (임시 파일 + rename)"""
+    if not METRICS_DIR:
+        return
+    snapshot = {metric.name: [[list(labels), value] for labels, value in metric._values.items()]
+                for metric in _registry}
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".metrics.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(fastjson.dumps(snapshot))
+        os.replace(tmp_path, os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json"))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+async def flush_loop():
+    """METRICS_FLUSH_INTERVAL마다 스냅샷 기록 (lifespan에서 task로 실행, 취소 시 마지막으로 한 번 더)"""
+    try:
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                write_snapshot()
+            except OSError:
+                pass  # 다음 주기에 다시 시도
+    finally:
+        write_snapshot()
@@ -8,6 +8,25 @@ import os
 BIG_MODEL = os.getenv("CODEX_BIG_MODEL", "gpt-5.3-codex")
 SMALL_MODEL = os.getenv("CODEX_SMALL_MODEL", "gpt-5.3-codex")
 THINKING_MODEL = os.getenv("CODEX_THINKING_MODEL", "gpt-5.3-codex")
+# 업스트림 실패(429/5xx) 시 순서대로 시도할 대체 모델 (쉼표 구분, 비어 있으면 failover 없음)
+# 예: CODEX_FALLBACK_MODELS=gpt-5.3-codex-spark
+FALLBACK_MODELS = [
+    m.strip() for m in os.getenv("CODEX_FALLBACK_MODELS", "").split(",") if m.strip()
+]
+
+# 모델별 입력 context window (토큰) - CODEX_CONTEXT_WINDOWS로 덮어쓰기
+# 예: CODEX_CONTEXT_WINDOWS=gpt-5.3-codex=272000,gpt-5.3-codex-spark=128000
+CONTEXT_WINDOWS = {
+    "gpt-5.3-codex": 272000,
+    "gpt-5.3-codex-spark": 128000,
+    "gpt-5.2-codex": 272000,
+}
+for _pair in os.getenv("CODEX_CONTEXT_WINDOWS", "").split(","):
+    _name, _, _limit = _pair.partition("=")
+    if _name.strip() and _limit.strip().isdigit():
+        CONTEXT_WINDOWS[_name.strip()] = int(_limit)
+# 목록에 없는 모델의 context window
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("CODEX_DEFAULT_CONTEXT_WINDOW", "272000"))
 
 
 def map_model(anthropic_model: str) -> str:
@@ -23,3 +42,25 @@ def map_model(anthropic_model: str) -> str:
     if name.startswith(("gpt-", "o1", "o3", "o4")):
         return anthropic_model
     return BIG_MODEL
+
+
+def fallback_chain(codex_model: str) -> list[str]:
+    """failover 순서: 매핑된 모델 → FALLBACK_MODELS (중복 제외)"""
+    return [codex_model] + [m for m in FALLBACK_MODELS if m != codex_model]
+
+
+def context_window(codex_model: str) -> int:
+    """Codex 모델의 입력 context window (토큰)"""
+    return CONTEXT_WINDOWS.get(codex_model, DEFAULT_CONTEXT_WINDOW)
+
+
+# 업스트림 대기열 우선순위 (작을수록 먼저): 대화형 opus/sonnet 턴 → 백그라운드 haiku 호출
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+def model_priority(anthropic_model: str) -> int:
+    """Anthropic 모델명으로 요청 우선순위 결정 (Claude Code는 haiku를 보조 작업에 사용)"""
+    if "haiku" in anthropic_model.lower():
+        return PRIORITY_BACKGROUND
+    return PRIORITY_INTERACTIVE
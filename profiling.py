@@ -0,0 +1,180 @@
+"""요청별 프로파일링 - 단계별 span 기록 + (선택) cProfile 덤프 + 최근 trace 링 버퍼
+
+켜는 방법 (기본은 꺼짐):
+- 요청 헤더 PROFILE_HEADER: "1" → 단계별 span, "cprofile" → span + cProfile 덤프
+- PROFILE_SAMPLE_RATE: 0~1 비율로 무작위 요청 trace (PROFILE_CPROFILE=true면 cProfile도)
+
+cProfile은 이벤트 루프 스레드 전체를 기록하므로 같은 시간에 처리된 다른 요청도 함께 잡힌다.
+trace는 ContextVar로 전달되어 업스트림/스케줄러 등 깊은 곳에서도 span()으로 기록한다.
+꺼져 있으면 span()은 ContextVar 조회 후 공유 nullcontext를 반환할 뿐이다.
+최근 trace는 /debug/traces 에서 볼 수 있다.
+"""
+import cProfile
+import itertools
+import os
+import random
+import time
+from collections import deque
+from contextlib import aclosing, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import AsyncIterator
+
+from log import get_logger
+
+logger = get_logger("profiling")
+
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "x-proxy-profile").lower()
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "false").lower() == "true"
+# cProfile 덤프 디렉토리 (.prof 파일, snakeviz / python -m pstats 로 확인)
+PROFILE_DIR = os.path.expanduser(os.getenv("PROFILE_DIR", "/tmp/codex-proxy-profiles"))
+# 보관할 최근 trace 수
+PROFILE_TRACES = int(os.getenv("PROFILE_TRACES", "200"))
+
+_NULL = nullcontext()
+_ids = itertools.count(1)
+_traces: deque["Trace"] = deque(maxlen=PROFILE_TRACES)
+# cProfile은 스레드 단위라 동시에 하나만 실행
+_active_profile: "Trace | None" = None
+
+current_trace: ContextVar["Trace | None"] = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, path: str, cprofile: bool):
+        self.id = f"t{next(_ids)}-{int(time.time())}"
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans: list[dict] = []
+        self.marks: dict[str, float] = {}
+        self.attrs: dict = {}
+        self.status: int | None = None
+        self.duration_ms: float | None = None
+        self.profile_file: str | None = None
+        self._profile: cProfile.Profile | None = None
+        if cprofile:
+            self._start_profile()
+
+    def _offset(self, t: float) -> float:
+        return round((t - self.started) * 1000, 3)
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.spans.append({
+                "name": name, "start_ms": self._offset(start), "duration_ms": round((end - start) * 1000, 3),
+            })
+
+    def mark(self, name: str):
+        """시점 기록 (첫 이벤트/첫 프레임 등) - 같은 이름은 처음 한 번만"""
+        if name not in self.marks:
+            self.marks[name] = self._offset(time.perf_counter())
+
+    def _start_profile(self):
+        global _active_profile
+        if _active_profile is not None:
+            self.attrs["cprofile"] = "skipped (another profile running)"
+            return
+        _active_profile = self
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def _stop_profile(self):
+        global _active_profile
+        if self._profile is None:
+            return
+        self._profile.disable()
+        _active_profile = None
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profile_file = os.path.join(PROFILE_DIR, f"{self.id}.prof")
+            self._profile.dump_stats(self.profile_file)
+        except OSError as e:
+            logger.warning("cProfile 저장 실패: %s", e)
+        self._profile = None
+
+    def finish(self, status: int | None):
+        if self.duration_ms is not None:
+            return
+        self.status = status
+        self.duration_ms = self._offset(time.perf_counter())
+        self._stop_profile()
+        _traces.append(self)
+        logger.info("⏱ Trace %s | %s %.1fms | %s", self.id, status, self.duration_ms,
+                    " ".join(f"{s['name']}={s['duration_ms']:.1f}" for s in self.spans))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "path": self.path,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+            "spans": self.spans,
+            "marks": self.marks,
+            "profile_file": self.profile_file,
+        }
+
+
+def start(path: str, headers) -> Trace | None:
+    """요청 trace 시작 (헤더 또는 샘플링으로 켜진 경우만, 아니면 None)"""
+    value = headers.get(PROFILE_HEADER) if headers is not None else None
+    if value:
+        cprofile = value.lower() == "cprofile"
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        cprofile = PROFILE_CPROFILE
+    else:
+        return None
+    trace = Trace(path, cprofile)
+    current_trace.set(trace)
+    return trace
+
+
+def span(name: str):
+    """현재 요청의 단계 시간 기록 (trace가 없으면 아무것도 하지 않음)"""
+    trace = current_trace.get()
+    if trace is None:
+        return _NULL
+    return trace.span(name)
+
+
+def attr(key: str, value):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attrs[key] = value
+
+
+def attach(trace: Trace, response):
+    """응답에 trace id 헤더 추가, 스트리밍이면 마지막 프레임 전송 후 trace 종료"""
+    response.headers["x-proxy-trace-id"] = trace.id
+    body_iterator = getattr(response, "body_iterator", None)
+    if body_iterator is None:
+        trace.finish(response.status_code)
+    else:
+        response.body_iterator = _traced_stream(trace, body_iterator, response.status_code)
+    return response
+
+
+async def _traced_stream(trace: Trace, frames: AsyncIterator, status: int) -> AsyncIterator:
+    try:
+        with trace.span("stream"):
+            async with aclosing(frames):
+                async for frame in frames:
+                    trace.mark("first_frame")
+                    yield frame
+    finally:
+        trace.finish(status)
+
+
+def recent_traces(limit: int = 50) -> list[dict]:
+    return [t.to_dict() for t in list(_traces)[-limit:][::-1]]
+
+
+def get_trace(trace_id: str) -> dict | None:
+    return next((t.to_dict() for t in _traces if t.id == trace_id), None)
@@ -0,0 +1,286 @@
+"""Responses API 이벤트 리듀서 - 스트리밍/non-streaming 공용 상태 머신
+
+같은 이벤트 처리 규칙으로
+- 스트리밍: Anthropic SSE 프레임을 바로 만들어 내보내고
+- non-streaming: 블록별 조각을 리스트에 모아 마지막에 한 번만 join 해서 최종 메시지를 만든다.
+"""
+import time
+import uuid
+
+import fastjson
+from sse import (
+    block_stop_frame,
+    encode_frame,
+    input_json_delta_frame,
+    text_block_start_frame,
+    text_delta_frame,
+    tool_block_start_frame,
+)
+
+_NO_FRAMES: list = []
+
+
+class ResponseReducer:
+    """Responses API 이벤트를 받아 Anthropic 메시지로 변환
+
+    emit_frames=False 이면 SSE 프레임을 만들지 않고 상태만 누적한다 (non-streaming).
+    coalesce_bytes>0 이면 같은 블록의 연속 델타를 그 크기(문자 수)까지 모아 한 프레임으로
+    보낸다. 블록 경계에서는 즉시 flush 되며, 시간 기준 flush는 호출자가 flush()로 처리한다.
+    """
+
+    def __init__(self, model: str, emit_frames: bool = True, coalesce_bytes: int = 0):
+        self.model = model
+        self.emit_frames = emit_frames
+        self.msg_id = f"msg_{uuid.uuid4().hex[:24]}"
+
+        # 완성된/진행 중인 블록: {"type": "text"|"tool_use", "parts": [...], ...}
+        self.blocks: list[dict] = []
+        self._open: dict | None = None
+        # output_item.added 로 미리 받은 function_call 정보 (item_id → item)
+        self._pending_calls: dict[str, dict] = {}
+        # 이미 블록으로 내보낸 function_call (item_id / call_id)
+        self._emitted_calls: set[str] = set()
+
+        # 델타 병합 (coalescing) 버퍼 - 항상 현재 열린 블록의 델타
+        self.coalesce_bytes = coalesce_bytes if emit_frames else 0
+        self._pending: list[str] = []
+        self._pending_size = 0
+        self.pending_since = 0.0
+
+        self.completed = False
+        self.stop_reason = "end_turn"
+        self.has_tool = False
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+
+    # ── 프레임 생성 ──────────────────────────────────────────────
+
+    def start(self) -> list[bytes]:
+        """message_start 프레임"""
+        if not self.emit_frames:
+            return _NO_FRAMES
+        return [encode_frame("message_start", {
+            "type": "message_start",
+            "message": {
+                "id": self.msg_id,
+                "type": "message",
+                "role": "assistant",
+                "content": [],
+                "model": self.model,
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": {"input_tokens": 0, "output_tokens": 0},
+            },
+        })]
+
+    def feed(self, event: dict) -> list[bytes]:
+        """이벤트 하나 처리 → 내보낼 프레임 목록"""
+        frames: list[bytes] = [] if self.emit_frames else _NO_FRAMES
+        etype = event.get("type", "")
+
+        # 텍스트 출력
+        if etype == "response.output_text.delta":
+            if self._open is None or self._open["type"] != "text":
+                self._close(frames)
+                self._open_block({"type": "text", "parts": []}, frames)
+            self._delta(event.get("delta", ""), frames)
+
+        # 텍스트 블록 완료
+        elif etype == "response.output_text.done":
+            if self._open is not None and self._open["type"] == "text":
+                self._close(frames)
+
+        # function_call 정보 선등록 (이후 arguments.delta 에는 item_id 만 옴)
+        elif etype == "response.output_item.added":
+            item = event.get("item", {})
+            if item.get("type") == "function_call":
+                self._pending_calls[item.get("id", "")] = item
+
+        # function_call 인자 스트리밍
+        elif etype == "response.function_call_arguments.delta":
+            item_id = event.get("item_id", "")
+            if (
+                self._open is None
+                or self._open["type"] != "tool_use"
+                or (item_id and self._open["item_id"] not in ("", item_id))
+            ):
+                self._close(frames)
+                item = self._pending_calls.get(item_id, {})
+                self._open_tool(
+                    item_id,
+                    event.get("call_id") or item.get("call_id", ""),
+                    event.get("name") or item.get("name", ""),
+                    frames,
+                )
+            self._delta(event.get("delta", ""), frames)
+
+        # function_call 인자 완료
+        elif etype == "response.function_call_arguments.done":
+            if self._open is not None and self._open["type"] == "tool_use":
+                self._close(frames)
+
+        # output item 완료 - 델타 없이 한 번에 온 function_call 처리
+        elif etype == "response.output_item.done":
+            item = event.get("item", {})
+            if item.get("type") == "function_call" and not self._already_emitted(item):
+                self._close(frames)
+                self._open_tool(
+                    item.get("id", ""), item.get("call_id", ""), item.get("name", ""), frames
+                )
+                self._delta(item.get("arguments", "{}"), frames)
+                self._close(frames)
+
+        # 응답 완료
+        elif etype == "response.completed":
+            resp = event.get("response", {})
+            usage = resp.get("usage", {})
+            self.input_tokens = usage.get("input_tokens", 0)
+            self.output_tokens = usage.get("output_tokens", 0)
+            # 업스트림 프롬프트 캐시 적중분 → Anthropic cache_read_input_tokens
+            self.cached_tokens = (usage.get("input_tokens_details") or {}).get("cached_tokens", 0)
+
+            # 열린 블록 닫기
+            self._close(frames)
+
+            output = resp.get("output", [])
+            self.has_tool = any(i.get("type") == "function_call" for i in output) or any(
+                b["type"] == "tool_use" for b in self.blocks
+            )
+            self.stop_reason = "tool_use" if self.has_tool else "end_turn"
+            self.completed = True
+
+            if self.emit_frames:
+                frames.append(encode_frame("message_delta", {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": self.stop_reason, "stop_sequence": None},
+                    "usage": self.usage(),
+                }))
+
+        return frames
+
+    def finish(self) -> list[bytes]:
+        """스트림 종료 - 열린 블록 닫기 + message_stop"""
+        frames: list[bytes] = [] if self.emit_frames else _NO_FRAMES
+        self._close(frames)
+        if self.emit_frames:
+            frames.append(encode_frame("message_stop", {"type": "message_stop"}))
+        return frames
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def flush(self) -> list[bytes]:
+        """모아 둔 델타를 프레임으로 내보냄 (flush 간격 타이머용)"""
+        frames: list[bytes] = []
+        self._flush_pending(frames)
+        return frames
+
+    # ── 최종 메시지 (non-streaming) ──────────────────────────────
+
+    def message(self) -> dict:
+        """누적된 블록으로 Anthropic 응답 생성 (블록당 join 한 번)"""
+        content = []
+        for block in self.blocks:
+            if block["type"] == "text":
+                text = "".join(block["parts"])
+                if text:
+                    content.append({"type": "text", "text": text})
+            else:
+                try:
+                    args = fastjson.loads("".join(block["parts"]) or "{}")
+                except ValueError:
+                    args = {}
+                content.append({
+                    "type": "tool_use",
+                    "id": block["id"],
+                    "name": block["name"],
+                    "input": args,
+                })
+        return {
+            "id": self.msg_id,
+            "type": "message",
+            "role": "assistant",
+            "content": content,
+            "model": self.model,
+            "stop_reason": self.stop_reason,
+            "stop_sequence": None,
+            "usage": self.usage(),
+        }
+
+    def usage(self) -> dict:
+        """Anthropic usage (input_tokens는 캐시 적중분을 제외한 나머지)"""
+        return {
+            "input_tokens": self.input_tokens - self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_read_input_tokens": self.cached_tokens,
+            "cache_creation_input_tokens": 0,
+        }
+
+    # ── 내부 ────────────────────────────────────────────────────
+
+    def _open_block(self, block: dict, frames: list[bytes]):
+        block["index"] = len(self.blocks)
+        self.blocks.append(block)
+        self._open = block
+        if self.emit_frames:
+            if block["type"] == "text":
+                frames.append(text_block_start_frame(block["index"]))
+            else:
+                frames.append(
+                    tool_block_start_frame(block["index"], block["id"], block["name"])
+                )
+
+    def _open_tool(self, item_id: str, call_id: str, name: str, frames: list[bytes]):
+        for key in (item_id, call_id):
+            if key:
+                self._emitted_calls.add(key)
+        self._open_block({
+            "type": "tool_use",
+            "item_id": item_id,
+            "id": call_id or f"toolu_{uuid.uuid4().hex[:24]}",
+            "name": name,
+            "parts": [],
+        }, frames)
+
+    def _already_emitted(self, item: dict) -> bool:
+        return any(
+            key and key in self._emitted_calls
+            for key in (item.get("id"), item.get("call_id"))
+        )
+
+    def _delta(self, text: str, frames: list[bytes]):
+        self._open["parts"].append(text)
+        if not self.emit_frames:
+            return
+        if self.coalesce_bytes <= 0:
+            frames.append(self._delta_frame(text))
+            return
+        if not self._pending:
+            self.pending_since = time.monotonic()
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.coalesce_bytes:
+            self._flush_pending(frames)
+
+    def _delta_frame(self, text: str) -> bytes:
+        if self._open["type"] == "text":
+            return text_delta_frame(self._open["index"], text)
+        return input_json_delta_frame(self._open["index"], text)
+
+    def _flush_pending(self, frames: list[bytes]):
+        if not self._pending:
+            return
+        pending = self._pending
+        frames.append(self._delta_frame(pending[0] if len(pending) == 1 else "".join(pending)))
+        self._pending = []
+        self._pending_size = 0
+
+    def _close(self, frames: list[bytes]):
+        if self._open is None:
+            return
+        self._flush_pending(frames)
+        if self.emit_frames:
+            frames.append(block_stop_frame(self._open["index"]))
+        self._open = None
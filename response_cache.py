@@ -0,0 +1,206 @@
+"""응답 캐시 - 완전히 같은 요청(주제/제목 감지 등 반복 side request)의 응답 재사용 (opt-in)
+
+- 키: 변환된 Responses body의 정규화 해시 (stream / prompt_cache_key 제외)
+- 값: 완료된 응답의 이벤트 시퀀스 (연속 델타는 하나로 합쳐 저장)
+  → 히트 시 같은 리듀서로 재생하므로 SSE/JSON 어느 쪽으로든 응답 가능
+- 메모리: TTL + 크기 기반 LRU / 디스크(선택): SQLite, 재시작 후에도 유지
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator
+
+from cache import LRUCache, canonical_json, digest
+import fastjson
+from log import get_logger
+
+logger = get_logger("response_cache")
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "32"))
+# 디스크 캐시 경로 (비어 있으면 메모리만 사용)
+RESPONSE_CACHE_DB = os.path.expanduser(os.getenv("RESPONSE_CACHE_DB", ""))
+RESPONSE_CACHE_DB_MAX_MB = float(os.getenv("RESPONSE_CACHE_DB_MAX_MB", "256"))
+
+# 캐시 키에서 제외할 필드 (응답 내용에 영향 없음)
+_KEY_EXCLUDE = ("stream", "prompt_cache_key")
+
+# 재생에 필요한 이벤트만 저장
+_KEEP_EVENTS = {
+    "response.output_text.delta",
+    "response.output_text.done",
+    "response.output_item.added",
+    "response.output_item.done",
+    "response.function_call_arguments.delta",
+    "response.function_call_arguments.done",
+    "response.completed",
+}
+_DELTA_EVENTS = {"response.output_text.delta", "response.function_call_arguments.delta"}
+
+
+def cache_key(resp_body: dict) -> str:
+    body = {k: v for k, v in resp_body.items() if k not in _KEY_EXCLUDE}
+    return digest(canonical_json(body))
+
+
+class _DiskTier:
+    """SQLite 디스크 캐시 (블로킹 호출은 asyncio.to_thread 로 실행)"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, expires REAL, accessed REAL, size INTEGER, data BLOB)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> tuple[float, list[dict], int] | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT expires, data FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return row[0], fastjson.loads(row[1]), len(row[1])
+
+    def put(self, key: str, expires: float, data: bytes):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, expires, time.time(), len(data), data),
+            )
+            self._db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # 오래 안 쓴 항목부터 상한 아래로 내려갈 때까지 삭제
+                rows = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed"
+                ).fetchall()
+                for old_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= size
+            self._db.commit()
+
+
+class ResponseCache:
+    def __init__(self):
+        self._memory = LRUCache(RESPONSE_CACHE_ENTRIES, int(RESPONSE_CACHE_MAX_MB * 1024 * 1024))
+        self._disk: _DiskTier | None = None
+        self.disk_hits = 0
+        if RESPONSE_CACHE_DB:
+            try:
+                self._disk = _DiskTier(RESPONSE_CACHE_DB, int(RESPONSE_CACHE_DB_MAX_MB * 1024 * 1024))
+            except sqlite3.Error as e:
+                logger.warning("디스크 응답 캐시 비활성 (%s): %s", RESPONSE_CACHE_DB, e)
+
+    async def get(self, key: str) -> list[dict] | None:
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires, events = entry
+            if expires >= time.time():
+                return events
+            self._memory.pop(key)
+        if self._disk is None:
+            return None
+        found = await asyncio.to_thread(self._disk.get, key)
+        if found is None:
+            return None
+        self.disk_hits += 1
+        expires, events, size = found
+        self._memory.put(key, (expires, events), size)
+        return events
+
+    async def put(self, key: str, events: list[dict]):
+        expires = time.time() + RESPONSE_CACHE_TTL
+        # .done 이벤트가 델타 전체 텍스트를 다시 담으므로 직렬화 크기로 집계
+        data = fastjson.dumps(events)
+        self._memory.put(key, (expires, events), len(data))
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.put, key, expires, data)
+            except sqlite3.Error as e:
+                logger.warning("디스크 응답 캐시 저장 실패: %s", e)
+
+    def stats(self) -> dict:
+        stats = self._memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["disk"] = bool(self._disk)
+        return stats
+
+
+def _compact(event: dict) -> dict:
+    """저장용으로 필요한 필드만 남김"""
+    if event.get("type") == "response.completed":
+        resp = event.get("response", {})
+        return {
+            "type": "response.completed",
+            "response": {
+                "usage": resp.get("usage", {}),
+                "output": [{"type": i.get("type")} for i in resp.get("output", [])],
+            },
+        }
+    return event
+
+
+async def record(
+    events: AsyncIterator[dict], key: str, cache: "ResponseCache"
+) -> AsyncIterator[dict]:
+    """이벤트를 그대로 전달하면서 모아 두고, response.completed까지 받으면 캐시에 기록"""
+    recorded: list[dict] = []
+    completed = False
+    async for event in events:
+        yield event
+        etype = event.get("type")
+        if etype in _KEEP_EVENTS:
+            recorded.append(event)
+            completed = completed or etype == "response.completed"
+    if completed:
+        await cache.put(key, _merge_deltas(recorded))
+
+
+def _merge_deltas(events: list[dict]) -> list[dict]:
+    """같은 블록의 연속 델타를 하나로 합치고 불필요한 필드 제거"""
+    merged: list[dict] = []
+    run: list[str] = []
+    for event in events:
+        etype = event["type"]
+        last = merged[-1] if merged else None
+        if (
+            etype in _DELTA_EVENTS
+            and last is not None
+            and last["type"] == etype
+            and last.get("item_id") == event.get("item_id")
+        ):
+            run.append(event.get("delta", ""))
+            continue
+        if run:
+            merged[-1] = {**merged[-1], "delta": "".join(run)}
+        run = [event.get("delta", "")] if etype in _DELTA_EVENTS else []
+        merged.append(_compact(event))
+    if run:
+        merged[-1] = {**merged[-1], "delta": "".join(run)}
+    return merged
+
+
+async def replay(events: list[dict]) -> AsyncIterator[dict]:
+    for event in events:
+        yield event
+
+
+cache = ResponseCache() if RESPONSE_CACHE else None
@@ -0,0 +1,207 @@
+"""업스트림 호출 admission control - 모델별 동시 실행 제한 + 우선순위 대기열
+
+- 매핑된 Codex 모델마다 동시에 업스트림으로 나가는 요청 수를 제한
+- 자리가 없으면 우선순위(대화형 opus/sonnet → 백그라운드 haiku) 순으로 대기
+- 대기열이 가득 찼거나 대기 시간이 SCHED_QUEUE_TIMEOUT을 넘으면 Overloaded
+  → 서버가 Anthropic overloaded_error(529)로 즉시 응답 (클라이언트가 알아서 재시도)
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import weakref
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable
+
+from log import get_logger
+import profiling
+
+logger = get_logger("scheduler")
+
+# 모델별 기본 동시 실행 수 (0이면 제한 없음 - 기본값, 슬롯은 스트림이 끝날 때까지 유지됨)
+SCHED_MAX_CONCURRENT = int(os.getenv("SCHED_MAX_CONCURRENT", "0"))
+# 모델별 개별 한도: "gpt-5.3-codex=8,gpt-5.3-codex-spark=16"
+SCHED_MODEL_LIMITS = os.getenv("SCHED_MODEL_LIMITS", "")
+# 모델별 최대 대기 요청 수
+SCHED_QUEUE_SIZE = int(os.getenv("SCHED_QUEUE_SIZE", "32"))
+# 대기열에서 기다리는 최대 시간 (초)
+SCHED_QUEUE_TIMEOUT = float(os.getenv("SCHED_QUEUE_TIMEOUT", "30"))
+
+
+def _parse_limits(spec: str) -> dict[str, int]:
+    limits = {}
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip():
+            try:
+                limits[name.strip()] = int(value)
+            except ValueError:
+                logger.warning("SCHED_MODEL_LIMITS 항목 무시: %s", part)
+    return limits
+
+
+_MODEL_LIMITS = _parse_limits(SCHED_MODEL_LIMITS)
+
+Opener = Callable[[], Awaitable[AsyncIterator[dict]]]
+
+
+class Overloaded(Exception):
+    """대기열 초과 또는 대기 시간 초과"""
+
+
+class _Lane:
+    """모델 하나의 실행 슬롯 + 우선순위 대기열 (priority 값이 작을수록 먼저)"""
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = limit
+        self.active = 0
+        self._queue: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.waiting = 0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and self.waiting == 0:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if self.waiting >= SCHED_QUEUE_SIZE and not self._evict_below(priority):
+            self.rejected += 1
+            raise Overloaded(f"{self.model}: queue full ({self.waiting} waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), SCHED_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            self.timeouts += 1
+            raise Overloaded(f"{self.model}: queued {SCHED_QUEUE_TIMEOUT:g}s without a slot")
+        except BaseException:
+            self._abandon(future)
+            raise
+        # 슬롯은 release()에서 그대로 넘겨받음 (active 유지)
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def release(self):
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self.waiting -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _abandon(self, future: asyncio.Future):
+        if future.done() and not future.cancelled() and future.exception() is None:
+            # 슬롯을 넘겨받은 직후 취소/타임아웃 → 슬롯 반환
+            self.release()
+            return
+        if not future.done():
+            future.cancel()
+            self.waiting -= 1
+
+    def _evict_below(self, priority: int) -> bool:
+        """대기열이 가득 찼을 때 더 낮은 우선순위 대기 요청 하나를 밀어냄"""
+        worst = None
+        for entry in self._queue:
+            if not entry[2].done() and (worst is None or entry[:2] > worst[:2]):
+                worst = entry
+        if worst is None or worst[0] <= priority:
+            return False
+        worst[2].set_exception(Overloaded(f"{self.model}: preempted by higher priority request"))
+        self.waiting -= 1
+        self.rejected += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+_lanes: dict[str, _Lane] = {}
+
+
+def _lane(model: str) -> _Lane | None:
+    lane = _lanes.get(model)
+    if lane is None:
+        limit = _MODEL_LIMITS.get(model, SCHED_MAX_CONCURRENT)
+        if limit <= 0:
+            return None
+        lane = _lanes[model] = _Lane(model, limit)
+    return lane
+
+
+async def run(model: str, priority: int, opener: Opener) -> AsyncIterator[dict]:
+    """슬롯을 확보한 뒤 opener로 이벤트 스트림을 열고, 스트림이 끝나면 슬롯 반환
+
+    자리가 없으면 우선순위 순으로 대기하고, 대기열 초과/대기 시간 초과는 Overloaded.
+    """
+    lane = _lane(model)
+    if lane is None:
+        return await opener()
+    try:
+        with profiling.span("scheduler_wait"):
+            await lane.acquire(priority)
+    except Overloaded as e:
+        logger.warning("🚦 Overloaded | %s", e)
+        raise
+    held = _Slot(lane)
+    try:
+        events = await opener()
+    except BaseException:
+        held.release()
+        raise
+    stream = _holding(held, events)
+    # 응답이 한 번도 소비되지 않고 버려져도 슬롯이 새지 않도록
+    weakref.finalize(stream, held.release)
+    return stream
+
+
+class _Slot:
+    """확보한 슬롯 (release는 한 번만 적용)"""
+
+    __slots__ = ("lane", "released", "__weakref__")
+
+    def __init__(self, lane: _Lane):
+        self.lane = lane
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.lane.release()
+
+
+async def _holding(held: _Slot, events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    try:
+        async with aclosing(events):
+            async for event in events:
+                yield event
+    finally:
+        held.release()
+
+
+def scheduler_stats() -> dict:
+    return {model: lane.stats() for model, lane in _lanes.items()}
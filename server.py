@@ -1,23 +1,111 @@
 """Codex-Claude Proxy - Anthropic Messages API → ChatGPT Responses API (OAuth)"""
+import asyncio
+import logging
+import math
 import os
-import uuid
+import time
+from contextlib import asynccontextmanager
+
 import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from auth import TokenManager
-from converter import anthropic_to_responses, responses_to_anthropic
-from stream import convert_stream
-from models import map_model
+from accounts import TokenPool
+from converter import (
+    anthropic_to_responses,
+    responses_to_anthropic,
+    message_cache_stats,
+    tools_cache_stats,
+)
+from stream import convert_events
+from models import map_model, model_priority, fallback_chain
+from reducer import ResponseReducer
+from tokens import count_request_tokens, load_encoder, token_cache_stats
+import upstream
+import session
+import response_cache
+import inflight
+import scheduler
+import metrics
+import fastjson
+import profiling
+import images
+import compaction
+import context_window
+from log import get_logger
+
+logger = get_logger("proxy")
 
 # ChatGPT 백엔드 (OAuth 토큰 사용 가능, 구독 기반)
 CHATGPT_API_URL = os.getenv(
     "CHATGPT_API_URL", "https://chatgpt.com/backend-api/codex/responses"
 )
 PORT = int(os.getenv("PROXY_PORT", "8082"))
-
-app = FastAPI(title="Codex-Claude Proxy")
+_IMPORTED = time.perf_counter()
+# 시작 시 토큰 갱신 / 업스트림 사전 연결을 기다리는 최대 시간 (초) - 넘으면 그대로 준비 완료
+_WARM_UP_TIMEOUT = 5.0
+# 워커 프로세스 수 (1보다 크면 uvicorn 멀티 워커, 캐시/동시 실행 제한은 워커별)
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# lifespan에서 생성 (import 시 auth.json을 읽지 않음)
+token_pool: TokenPool | None = None
+# /ready 상태 (토큰 로드 + 업스트림 사전 연결 후 ready)
+_startup = {"ready": False, "ready_ms": None, "upstream_warm": None}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """공유 업스트림 클라이언트 + 토큰 풀 + 백그라운드 작업 (사전 연결, 토큰 갱신, 토크나이저 로드, 메트릭 기록) 시작/정리"""
+    global token_pool
+    _startup.update(ready=False, ready_ms=None, upstream_warm=None)
+    await upstream.startup()
+    token_pool = TokenPool()
+    token_pool.start_background_refresh(upstream.get_client)
+    background = [asyncio.create_task(_warm_up()), asyncio.create_task(load_encoder())]
+    if metrics.METRICS_DIR:
+        background.append(asyncio.create_task(metrics.flush_loop()))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await token_pool.stop_background_refresh()
+        await upstream.shutdown()
+
+
+async def _warm_up():
+    """만료된 토큰 갱신 + 업스트림 커넥션 미리 연결 → /ready
+
+    각 단계는 _WARM_UP_TIMEOUT까지만 기다린다 (늦은 토큰 갱신은 백그라운드에서 계속).
+    """
+    client = upstream.get_client()
+
+    async def refresh(account):
+        try:
+            await asyncio.wait_for(account.manager.refresh_if_needed(client), _WARM_UP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("시작 시 토큰 갱신이 %gs 안에 끝나지 않음 (%s) → 백그라운드에서 계속",
+                           _WARM_UP_TIMEOUT, account.name)
+        except Exception as e:
+            logger.warning("시작 시 토큰 갱신 실패 (%s): %s", account.name, e)
+
+    *_, _startup["upstream_warm"] = await asyncio.gather(
+        *(refresh(account) for account in token_pool.accounts),
+        upstream.warm_up(CHATGPT_API_URL, _WARM_UP_TIMEOUT),
+    )
+    _startup["ready"] = True
+    _startup["ready_ms"] = round((time.perf_counter() - _IMPORTED) * 1000, 1)
+    logger.info("✅ Ready in %.0fms (accounts: %d, upstream warm: %s)",
+                _startup["ready_ms"], len(token_pool), _startup["upstream_warm"])
+
+
+app = FastAPI(title="Codex-Claude Proxy", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -25,11 +113,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-token_mgr = TokenManager()
-
 
-def _chatgpt_headers() -> dict:
-    """ChatGPT 백엔드 전용 헤더"""
+def _chatgpt_headers(token_mgr: TokenManager, session_id: str) -> dict:
+    """ChatGPT 백엔드 전용 헤더 (session_id는 대화별로 고정 → 프롬프트 캐시 재사용)"""
     headers = token_mgr.get_headers()
     headers.update({
         "Accept": "text/event-stream",
@@ -38,14 +124,45 @@ def _chatgpt_headers() -> dict:
         "Referer": "https://chatgpt.com/",
         "OpenAI-Beta": "responses=experimental",
         "originator": "codex_cli_rs",
-        "session_id": str(uuid.uuid4()),
+        "session_id": session_id,
     })
     return headers
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "token_expired": token_mgr.is_expired()}
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "token_expired": token_pool.is_expired(),
+        "prompt_cache": session.prompt_cache_stats(),
+        "caches": {
+            "messages": message_cache_stats(),
+            "tools": tools_cache_stats(),
+            "tokens": token_cache_stats(),
+            "images": images.image_stats(),
+            **({"responses": response_cache.cache.stats()} if response_cache.cache else {}),
+        },
+        "tool_output_compaction": compaction.compaction_stats(),
+        "context_window": context_window.context_stats(),
+        "inflight": inflight.inflight_stats(),
+        "scheduler": scheduler.scheduler_stats(),
+        "upstream": upstream.retry_stats(),
+        "accounts": token_pool.stats(),
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """시작 완료 여부 (실행 스크립트가 sleep 대신 폴링) - 준비 전에는 503"""
+    if not _startup["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready", **_startup, "token_expired": token_pool.is_expired()}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # 요청 카운터 (디버깅용)
@@ -53,259 +170,299 @@ _count_tokens_counter = 0
 
 @app.post("/v1/messages/count_tokens")
 async def count_tokens(request: Request):
-    """토큰 카운팅 (대략적인 추정)"""
+    """토큰 카운팅 (system/tools/messages, 메시지별 캐시)"""
     global _count_tokens_counter
     _count_tokens_counter += 1
 
-    body = await request.json()
-
-    # 간단한 토큰 추정: 1 token ≈ 4 characters
-    total_chars = 0
-    system_chars = 0
-    messages_chars = 0
-
-    # system 메시지
-    system = body.get("system", "")
-    if isinstance(system, str):
-        system_chars = len(system)
-        total_chars += system_chars
-    elif isinstance(system, list):
-        for block in system:
-            if block.get("type") == "text":
-                block_len = len(block.get("text", ""))
-                system_chars += block_len
-                total_chars += block_len
-
-    # messages
-    msg_count = len(body.get("messages", []))
-    for msg in body.get("messages", []):
-        content = msg.get("content", "")
-        if isinstance(content, str):
-            msg_len = len(content)
-            messages_chars += msg_len
-            total_chars += msg_len
-        elif isinstance(content, list):
-            for block in content:
-                if block.get("type") == "text":
-                    block_len = len(block.get("text", ""))
-                    messages_chars += block_len
-                    total_chars += block_len
-
-    # 대략적인 토큰 수 추정
-    input_tokens = total_chars // 4
+    body = fastjson.loads(await request.body())
+    counts = count_request_tokens(body)
 
     # 상세 로깅
-    print(f"[proxy] 🔢 count_tokens #{_count_tokens_counter} | "
-          f"system: {system_chars//4}t | messages: {msg_count}개({messages_chars//4}t) | "
-          f"total: {input_tokens}t")
+    logger.debug("🔢 count_tokens #%d | system: %dt | tools: %dt | messages: %d개(%dt) | total: %dt",
+                 _count_tokens_counter, counts["system"], counts["tools"],
+                 counts["message_count"], counts["messages"], counts["input_tokens"])
+
+    return {"input_tokens": counts["input_tokens"]}
 
-    # system 미리보기 (처음 100자)
-    if system_chars > 0:
-        system_preview = (system[:100] if isinstance(system, str)
-                         else system[0].get("text", "")[:100] if system else "")
-        if system_chars > 100:
-            print(f"[proxy]    system preview: {system_preview}...")
 
-    return {"input_tokens": input_tokens}
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 50):
+    """최근 요청 trace (PROFILE_HEADER 헤더 또는 PROFILE_SAMPLE_RATE로 켜진 요청)"""
+    return {"traces": profiling.recent_traces(limit)}
+
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str):
+    trace = profiling.get_trace(trace_id)
+    if trace is None:
+        return JSONResponse(status_code=404, content={"error": "trace not found"})
+    return trace
 
 
 @app.post("/v1/messages")
 async def messages(request: Request):
     """Anthropic Messages API → ChatGPT Responses API 프록시"""
-    body = await request.json()
+    trace = profiling.start(request.url.path, request.headers)
+    if trace is None:
+        return await _messages(request)
+    try:
+        response = await _messages(request)
+    except Exception:
+        trace.finish(500)
+        raise
+    return profiling.attach(trace, response)
+
+
+async def _messages(request: Request):
+    started = time.perf_counter()
+    with profiling.span("parse_json"):
+        body = fastjson.loads(await request.body())
     is_stream = body.get("stream", False)
     original_model = body.get("model", "")
 
-    # 토큰 갱신
-    await token_mgr.refresh_if_needed()
-
     # Anthropic → Responses API 변환
-    resp_body = anthropic_to_responses(body)
+    converting = time.perf_counter()
+    with profiling.span("convert"):
+        resp_body = anthropic_to_responses(body)
+    # 이전 턴의 큰 tool 결과 압축 (최근 결과는 그대로)
+    with profiling.span("compact"):
+        resp_body["input"], compacted_chars = compaction.compact_tool_outputs(resp_body["input"])
     mapped_model = resp_body["model"]
+    labels = (original_model, mapped_model)
+    metrics.current_labels.set(labels)
+    metrics.CONVERSION_SECONDS.observe(labels, time.perf_counter() - converting)
+    if compacted_chars:
+        metrics.TOOL_OUTPUT_CHARS_SAVED.inc(labels, compacted_chars)
+        profiling.attr("tool_output_chars_saved", compacted_chars)
+    # 모델 context window를 넘으면 오래된 턴 생략 (업스트림이 느린 업로드 후 거절하기 전에)
+    with profiling.span("context_window"):
+        fitted = context_window.fit(resp_body)
+    if fitted is not None:
+        metrics.CONTEXT_PRUNED.inc(labels)
+        profiling.attr("context_window", vars(fitted))
+    profiling.attr("model", f"{original_model} → {mapped_model}")
+    profiling.attr("stream", is_stream)
+
+    logger.info("%s → %s | stream=%s", original_model, mapped_model, is_stream)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        # 요청에 tools가 있는지 확인
+        if "tools" in resp_body:
+            logger.debug("🔧 Tools available: %d tools", len(resp_body["tools"]))
+
+        # 마지막 메시지 확인
+        if body.get("messages"):
+            last_msg = body["messages"][-1]
+            content = last_msg.get("content", "")
+            if isinstance(content, str):
+                preview = content[:100]
+            else:
+                preview = str(content)[:100]
+            logger.debug("📝 Last message: %s...", preview)
+
+    # 요청 key: 응답 캐시 + 동시 동일 요청 공유에 사용
+    request_key = None
+    if response_cache.cache is not None or inflight.INFLIGHT_DEDUP:
+        with profiling.span("request_key"):
+            request_key = response_cache.cache_key(resp_body)
+
+    # 응답 캐시 (opt-in): 완전히 같은 요청이면 업스트림 호출 없이 저장된 이벤트 재생
+    if response_cache.cache is not None:
+        with profiling.span("response_cache"):
+            cached = await response_cache.cache.get(request_key)
+        if cached is not None:
+            profiling.attr("response_cache", "hit")
+            logger.info("⚡ Response cache hit | %s", request_key[:12])
+            metrics.RESPONSE_CACHE_HITS.inc(labels)
+            metrics.REQUESTS.inc(labels + ("200",))
+            events = response_cache.replay(cached)
+            if is_stream:
+                return _streaming_response(convert_events(events, mapped_model, record_usage=False))
+            return JSONResponse(content=await _reduce(events, mapped_model, record_usage=False))
+
+    # 대화별 고정 session key (업스트림 프롬프트 캐시 적중 + 계정 sticky 라우팅)
+    session_id = session.session_key(body, request.headers)
+    if session.PROMPT_CACHE_KEY:
+        resp_body["prompt_cache_key"] = session_id
+
+    try:
+        with profiling.span("open_upstream"):
+            events, joined = await _open_upstream(
+                resp_body, session_id, request_key, model_priority(original_model)
+            )
+    except scheduler.Overloaded as e:
+        # 대기열 초과 → 300초 타임아웃 대신 즉시 529 (Claude Code가 백오프 후 재시도)
+        return _error_response(labels, 529, "overloaded_error", f"Overloaded: {e}")
+    except upstream.UpstreamError as e:
+        # 재시도/failover 후에도 실패 → 업스트림 상태 코드에 맞는 Anthropic 오류
+        logger.warning("upstream error: %d %s", e.status_code, e.message[:200])
+        status, error_type = _anthropic_error(e.status_code)
+        headers = {"retry-after": e.headers["retry-after"]} if "retry-after" in e.headers else None
+        return _error_response(labels, status, error_type, e.message, headers)
+    except httpx.HTTPError as e:
+        logger.warning("upstream connection error: %r", e)
+        return _error_response(
+            labels, 502, "api_error", f"Upstream connection error: {type(e).__name__}"
+        )
 
-    print(f"[proxy] {original_model} → {mapped_model} | stream={is_stream}")
-
-    # 요청에 tools가 있는지 확인
-    if "tools" in resp_body:
-        print(f"[proxy] 🔧 Tools available: {len(resp_body['tools'])} tools")
-
-    # 마지막 메시지 확인
-    if body.get("messages"):
-        last_msg = body["messages"][-1]
-        content = last_msg.get("content", "")
-        if isinstance(content, str):
-            preview = content[:100]
-        else:
-            preview = str(content)[:100]
-        print(f"[proxy] 📝 Last message: {preview}...")
-
-    headers = _chatgpt_headers()
-
+    metrics.REQUESTS.inc(labels + ("200",))
+    # 합류한 요청은 업스트림 usage가 leader 쪽에서 이미 집계됨
+    events = metrics.track(events, labels, started, usage=not joined)
+    profiling.attr("joined_inflight", joined)
     if is_stream:
-        return StreamingResponse(
-            _stream_proxy(resp_body, headers, mapped_model),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            },
-        )
+        return _streaming_response(convert_events(events, mapped_model, record_usage=not joined))
 
     # non-streaming: Codex API는 stream=true 필수 → 내부적으로 스트리밍 후 조합
-    anthropic_resp = await _collect_stream(resp_body, headers, mapped_model)
+    with profiling.span("collect"):
+        anthropic_resp = await _reduce(events, mapped_model, record_usage=not joined)
     return JSONResponse(content=anthropic_resp)
 
 
-async def _collect_stream(resp_body: dict, headers: dict, model: str) -> dict:
-    """non-streaming: 내부적으로 스트리밍 후 전체 응답 조합"""
-    import json as _json
+def _streaming_response(frames) -> StreamingResponse:
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        },
+    )
+
+
+# 업스트림 상태 코드 → (응답 상태 코드, Anthropic 오류 type)
+_ERROR_TYPES = {
+    400: (400, "invalid_request_error"),
+    401: (401, "authentication_error"),
+    403: (403, "permission_error"),
+    404: (404, "not_found_error"),
+    413: (413, "request_too_large"),
+    429: (429, "rate_limit_error"),
+    503: (529, "overloaded_error"),
+    529: (529, "overloaded_error"),
+}
+
+
+def _anthropic_error(status_code: int) -> tuple[int, str]:
+    if status_code in _ERROR_TYPES:
+        return _ERROR_TYPES[status_code]
+    if status_code >= 500:
+        return 502, "api_error"
+    return status_code, "invalid_request_error"
+
+
+def _error_response(
+    labels: tuple[str, str], status: int, error_type: str, message: str, headers: dict | None = None
+):
+    metrics.REQUESTS.inc(labels + (str(status),))
+    return JSONResponse(status_code=status, headers=headers, content={
+        "type": "error",
+        "error": {"type": error_type, "message": message},
+    })
 
-    resp_body["stream"] = True
-    msg_id = f"msg_{uuid.uuid4().hex[:24]}"
-    content_blocks: list[dict] = []
-    current_text = ""
-    current_tool: dict | None = None
-    tool_args = ""
-    input_tokens = 0
-    output_tokens = 0
-    stop_reason = "end_turn"
-
-    async with httpx.AsyncClient(timeout=300) as client:
-        async with client.stream(
-            "POST", CHATGPT_API_URL, json=resp_body, headers=headers
-        ) as resp:
-            if resp.status_code != 200:
-                error_body = await resp.aread()
-                print(f"[proxy] collect error: {resp.status_code} {error_body[:200]}")
-                return {
-                    "error": {"type": "proxy_error", "message": error_body.decode()[:500]}
-                }
-
-            buffer = ""
-            async for chunk in resp.aiter_bytes():
-                text = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
-                buffer += text
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    line = line.strip()
-                    if not line.startswith("data: "):
-                        continue
-                    payload = line[6:]
-                    if payload == "[DONE]":
-                        continue
-                    try:
-                        event = _json.loads(payload)
-                    except _json.JSONDecodeError:
-                        continue
-
-                    etype = event.get("type", "")
-
-                    if etype == "response.output_text.delta":
-                        current_text += event.get("delta", "")
-
-                    elif etype == "response.output_text.done":
-                        if current_text:
-                            content_blocks.append({"type": "text", "text": current_text})
-                            current_text = ""
-
-                    elif etype == "response.function_call_arguments.delta":
-                        if current_tool is None:
-                            current_tool = {
-                                "call_id": event.get("call_id", ""),
-                                "name": event.get("name", ""),
-                            }
-                        tool_args += event.get("delta", "")
-
-                    elif etype == "response.function_call_arguments.done":
-                        if current_tool:
-                            try:
-                                args = _json.loads(tool_args)
-                            except _json.JSONDecodeError:
-                                args = {}
-                            content_blocks.append({
-                                "type": "tool_use",
-                                "id": current_tool["call_id"] or f"toolu_{uuid.uuid4().hex[:24]}",
-                                "name": current_tool["name"],
-                                "input": args,
-                            })
-                            current_tool = None
-                            tool_args = ""
-
-                    elif etype == "response.output_item.done":
-                        item = event.get("item", {})
-                        if item.get("type") == "function_call":
-                            call_id = item.get("call_id", f"toolu_{uuid.uuid4().hex[:24]}")
-                            try:
-                                args = _json.loads(item.get("arguments", "{}"))
-                            except _json.JSONDecodeError:
-                                args = {}
-                            content_blocks.append({
-                                "type": "tool_use",
-                                "id": call_id,
-                                "name": item.get("name", ""),
-                                "input": args,
-                            })
-
-                    elif etype == "response.completed":
-                        r = event.get("response", {})
-                        usage = r.get("usage", {})
-                        input_tokens = usage.get("input_tokens", 0)
-                        output_tokens = usage.get("output_tokens", 0)
-                        out = r.get("output", [])
-                        has_tool = any(i.get("type") == "function_call" for i in out)
-                        stop_reason = "tool_use" if has_tool else "end_turn"
-
-                        # 응답 완료 로깅
-                        print(f"[proxy] ✅ Response completed | stop_reason: {stop_reason} | "
-                              f"has_tool: {has_tool} | tokens: {input_tokens}→{output_tokens}")
-
-    # 아직 닫히지 않은 텍스트 블록
-    if current_text:
-        content_blocks.append({"type": "text", "text": current_text})
 
-    return {
-        "id": msg_id,
-        "type": "message",
-        "role": "assistant",
-        "content": content_blocks,
-        "model": model,
-        "stop_reason": stop_reason,
-        "stop_sequence": None,
-        "usage": {
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-        },
-    }
+async def _reduce(events, model: str, record_usage: bool = True) -> dict:
+    """이벤트 스트림 → 최종 Anthropic 메시지 (스트리밍과 같은 리듀서 사용)"""
+    reducer = ResponseReducer(model, emit_frames=False)
+    async for event in events:
+        reducer.feed(event)
 
+    reducer.finish()
+    if reducer.completed:
+        if record_usage:
+            session.record_usage(reducer.input_tokens, reducer.cached_tokens)
+        # 응답 완료 로깅
+        logger.info("✅ Response completed | stop_reason: %s | has_tool: %s | tokens: %d→%d | cached: %d",
+                    reducer.stop_reason, reducer.has_tool,
+                    reducer.input_tokens, reducer.output_tokens, reducer.cached_tokens)
+    return reducer.message()
 
-async def _stream_proxy(resp_body: dict, headers: dict, model: str):
-    """스트리밍 프록시"""
+
+async def _open_upstream(
+    resp_body: dict, session_id: str, request_key: str | None, priority: int
+):
+    """업스트림 이벤트 스트림 열기 (스케줄러 슬롯 + 응답 캐시 기록 + 동시 동일 요청 공유)
+
+    클라이언트에 응답을 시작하기 전에 호출해서 대기열 초과/연결 오류를 먼저 확인한다.
+    반환: (이벤트 스트림, 다른 요청의 업스트림 호출에 합류했는지 여부)
+    """
     resp_body["stream"] = True
 
-    async with httpx.AsyncClient(timeout=300) as client:
-        async with client.stream(
-            "POST", CHATGPT_API_URL, json=resp_body, headers=headers
-        ) as resp:
-            if resp.status_code != 200:
-                error_body = await resp.aread()
-                print(f"[proxy] stream error: {resp.status_code} {error_body[:200]}")
-                yield (
-                    f'event: error\ndata: {{"type":"error","error":'
-                    f'{{"type":"proxy_error","message":"HTTP {resp.status_code}"}}}}\n\n'
+    async def opener():
+        events = await _open_with_account(resp_body, session_id, priority)
+        if request_key is not None and response_cache.cache is not None:
+            events = response_cache.record(events, request_key, response_cache.cache)
+        return events
+
+    return await inflight.open_shared(request_key, opener)
+
+
+async def _open_with_account(resp_body: dict, session_id: str, priority: int):
+    """계정 풀에서 계정을 골라 업스트림 연결 (429 받은 계정은 쉬게 하고 다음 계정으로)
+
+    스케줄러 슬롯은 시도마다 실제로 호출하는 모델(failover 포함) 기준으로 확보한다.
+    """
+    models = fallback_chain(resp_body["model"])
+    multi = len(token_pool) > 1
+    # 계정이 여러 개면 429는 같은 계정으로 재시도하지 않고 바로 다른 계정으로 넘김
+    retry_statuses = upstream.RETRY_STATUSES - {429} if multi else upstream.RETRY_STATUSES
+    tried: set[str] = set()
+    last_error: upstream.UpstreamError | None = None
+    while True:
+        account = token_pool.select(session_id, tried)
+        if account is None:
+            if last_error is not None:
+                raise last_error
+            retry_in = str(math.ceil(token_pool.retry_in()))
+            raise upstream.UpstreamError(
+                429, b"All accounts are rate limited", httpx.Headers({"retry-after": retry_in})
+            )
+        tried.add(account.name)
+
+        # 토큰 갱신
+        with profiling.span("token_refresh"):
+            await account.manager.refresh_if_needed(upstream.get_client())
+        headers = _chatgpt_headers(account.manager, session_id)
+        profiling.attr("account", account.name)
+        try:
+            with profiling.span("upstream_first_event"):
+                events = await upstream.open_events_retrying(
+                    CHATGPT_API_URL, resp_body, headers, models, retry_statuses,
+                    admit=lambda model, open_: scheduler.run(model, priority, open_),
+                    prepare=context_window.fit,
                 )
-                return
-
-            async for chunk in convert_stream(resp.aiter_bytes(), model):
-                yield chunk
+        except upstream.UpstreamError as e:
+            if e.status_code != 429 or not multi:
+                account.errors += 1
+                raise
+            account.cool_down(upstream.retry_after(e.headers))
+            last_error = e
+            continue
+        except httpx.HTTPError:
+            account.errors += 1
+            raise
+        return token_pool.track(account, events)
 
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
 
+    # uvicorn loop/http "auto"는 uvloop / httptools가 설치되어 있으면 사용
+    fast = [name for name in ("uvloop", "httptools") if importlib.util.find_spec(name)]
     print(f"🚀 Codex-Claude Proxy on http://0.0.0.0:{PORT}")
     print(f"   Target: {CHATGPT_API_URL}")
-    print(f"   Token expired: {token_mgr.is_expired()}")
+    print(f"   Runtime: {', '.join(fast) or 'asyncio + h11 (pip install uvloop httptools 권장)'}")
+    if WORKERS > 1:
+        print(f"   Workers: {WORKERS}")
     print()
     print("   사용법:")
     print(f'   ANTHROPIC_API_KEY="" ANTHROPIC_BASE_URL=http://localhost:{PORT} claude')
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    if WORKERS > 1:
+        # 워커들이 /metrics 값을 합산할 공유 디렉토리 (워커 프로세스는 환경변수를 물려받음)
+        if not os.environ.get("METRICS_DIR"):
+            import tempfile
+            os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="codex-proxy-metrics-")
+        metrics.clear_snapshots(os.environ["METRICS_DIR"])
+        uvicorn.run("server:app", host="0.0.0.0", port=PORT, workers=WORKERS, loop="auto", http="auto")
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT, loop="auto", http="auto")
@@ -0,0 +1,53 @@
+"""대화 세션 식별 - 업스트림 프롬프트 캐시 적중을 위한 안정적인 session key
+
+같은 대화의 턴들은 같은 key를 보내야 업스트림이 이전 턴의 프롬프트 prefix 캐시를
+재사용할 수 있다. 우선순위:
+1. 클라이언트가 보낸 세션 헤더 (SESSION_HEADER)
+2. Anthropic 요청의 metadata.user_id (Claude Code는 세션 id를 포함해서 보냄)
+3. system 프롬프트 + 첫 user 메시지 내용의 해시 (cache_control 제외)
+"""
+import hashlib
+import os
+import uuid
+
+from cache import canonical_json, without_cache_control
+
+SESSION_HEADER = os.getenv("SESSION_HEADER", "x-claude-code-session-id").lower()
+# Responses API body에 prompt_cache_key 포함 여부
+PROMPT_CACHE_KEY = os.getenv("PROMPT_CACHE_KEY", "true").lower() == "true"
+
+# 프롬프트 캐시 적중 통계
+_stats = {"requests": 0, "input_tokens": 0, "cached_tokens": 0, "hit_requests": 0}
+
+
+def session_key(body: dict, headers) -> str:
+    """요청 → 대화별로 고정된 session key (UUID 형식)"""
+    client_key = headers.get(SESSION_HEADER) if headers is not None else None
+    if client_key:
+        source = ["header", client_key]
+    elif (body.get("metadata") or {}).get("user_id"):
+        source = ["metadata", body["metadata"]["user_id"]]
+    else:
+        messages = body.get("messages") or []
+        first_user = next((m for m in messages if m.get("role") == "user"), None)
+        # 내용만 해시 (cache_control 마커는 턴마다 옮겨 다님)
+        source = ["prefix", without_cache_control(body.get("system")),
+                  without_cache_control(first_user.get("content")) if first_user else None]
+    digest = hashlib.blake2b(canonical_json(source), digest_size=16).digest()
+    return str(uuid.UUID(bytes=digest))
+
+
+def record_usage(input_tokens: int, cached_tokens: int):
+    """응답 완료 시 업스트림 usage 기록 (input_tokens는 캐시 포함 전체)"""
+    _stats["requests"] += 1
+    _stats["input_tokens"] += input_tokens
+    _stats["cached_tokens"] += cached_tokens
+    if cached_tokens:
+        _stats["hit_requests"] += 1
+
+
+def prompt_cache_stats() -> dict:
+    stats = dict(_stats)
+    total = stats["input_tokens"]
+    stats["token_hit_rate"] = round(stats["cached_tokens"] / total, 4) if total else 0.0
+    return stats
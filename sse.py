@@ -0,0 +1,180 @@
+"""SSE(Server-Sent Events) 파서/인코더
+
+파서 - 바이트 단위 증분 파싱
+
+- 바이트 버퍼에서 청크당 한 번, 마지막 이벤트 경계(빈 줄)까지 잘라내 처리
+  (줄마다 남은 문자열을 복사하는 `buffer.split("\\n", 1)` 방식은 청크가 클수록 이차 시간)
+- 줄바꿈(0x0A)은 UTF-8 멀티바이트 문자 안에 나타나지 않으므로, 완성된 이벤트 영역만
+  디코드하면 청크 경계에서 문자가 잘려도 안전
+- `event:` / 여러 줄 `data:` / `:` 주석 / LF·CRLF 줄바꿈 지원
+
+인코더 - Anthropic SSE 프레임을 bytes로 생성
+- 자주 나오는 프레임(text_delta, input_json_delta, content_block_start/stop)은
+  미리 만들어 둔 바이트 템플릿에 가변 부분(문자열)만 JSON 이스케이프해서 붙임
+- JSON은 fastjson (orjson이 설치되어 있으면 사용, 없으면 표준 json의 C 가속 함수)
+"""
+from json.encoder import encode_basestring_ascii
+from typing import AsyncIterator, NamedTuple
+
+import fastjson
+from fastjson import orjson
+
+
+class SSEEvent(NamedTuple):
+    event: str
+    data: str
+
+
+_new_event = tuple.__new__
+
+
+class SSEParser:
+    """feed()로 바이트 청크를 넣으면 완성된 이벤트 목록을 반환"""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        buf = self._buf
+        buf += chunk
+        if b"\r" in buf:
+            # CRLF → LF (CR만 남은 경우는 다음 청크의 LF와 합쳐질 때까지 보류)
+            buf[:] = buf.replace(b"\r\n", b"\n")
+        end = buf.rfind(b"\n\n")
+        if end < 0:
+            return []
+        text = buf[:end].decode("utf-8", "replace")
+        del buf[:end + 2]
+        return _parse_blocks(text.split("\n\n"))
+
+    def flush(self) -> list[SSEEvent]:
+        """스트림 종료 - 빈 줄 없이 끝난 마지막 이벤트 처리"""
+        if not self._buf:
+            return []
+        text = self._buf.decode("utf-8", "replace").replace("\r\n", "\n")
+        self._buf.clear()
+        return _parse_blocks(text.strip("\n").split("\n\n"))
+
+
+def _parse_blocks(blocks: list[str]) -> list[SSEEvent]:
+    """빈 줄로 구분된 이벤트 블록들 → SSEEvent 목록"""
+    events: list[SSEEvent] = []
+    append = events.append
+    for block in blocks:
+        # 빠른 경로: "event: X\ndata: Y" 또는 "data: Y" 한두 줄짜리 블록
+        if block.startswith("event: "):
+            name, _, rest = block.partition("\n")
+            if rest.startswith("data: ") and "\n" not in rest:
+                append(_new_event(SSEEvent, (name[7:], rest[6:])))
+                continue
+        elif block.startswith("data: ") and "\n" not in block:
+            append(_new_event(SSEEvent, ("message", block[6:])))
+            continue
+        event = _parse_block(block)
+        if event is not None:
+            append(event)
+    return events
+
+
+def _parse_block(block: str) -> SSEEvent | None:
+    """일반 경로: 여러 줄 data, 주석, 공백 없는 'field:value' 등"""
+    name = ""
+    data: list[str] = []
+    for line in block.split("\n"):
+        if not line or line[0] == ":":
+            continue  # 빈 줄 / 주석
+        field, sep, value = line.partition(":")
+        if sep and value[:1] == " ":
+            value = value[1:]
+        if field == "data":
+            data.append(value)
+        elif field == "event":
+            name = value
+        # id / retry 는 프록시에서 사용하지 않음
+    if not data:
+        return None
+    return _new_event(SSEEvent, (name or "message", "\n".join(data)))
+
+
+async def aiter_sse_data(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """바이트 스트림에서 SSE data 페이로드 추출 ([DONE] 제외)"""
+    parser = SSEParser()
+    async for chunk in stream:
+        for event in parser.feed(chunk):
+            if event.data != "[DONE]":
+                yield event.data
+    for event in parser.flush():
+        if event.data != "[DONE]":
+            yield event.data
+
+
+async def aiter_sse_json(stream: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """바이트 스트림에서 JSON 이벤트 추출 (파싱 실패한 페이로드는 건너뜀)"""
+    async for payload in aiter_sse_data(stream):
+        try:
+            yield fastjson.loads(payload)
+        except ValueError:
+            continue
+
+
+# ── 인코더 ────────────────────────────────────────────────────────
+
+_json_bytes = fastjson.dumps
+
+
+def _json_str(text: str) -> bytes:
+    """문자열 하나만 JSON 이스케이프 (따옴표 포함)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(text)
+        except TypeError:
+            pass
+    return encode_basestring_ascii(text).encode()
+
+
+# 블록 인덱스 → bytes (작은 수는 미리 생성)
+_INDEX = [str(i).encode() for i in range(256)]
+
+
+def _index(i: int) -> bytes:
+    return _INDEX[i] if 0 <= i < 256 else str(i).encode()
+
+
+_DELTA_HEAD = b'event: content_block_delta\ndata: {"type":"content_block_delta","index":'
+_TEXT_DELTA_MID = b',"delta":{"type":"text_delta","text":'
+_JSON_DELTA_MID = b',"delta":{"type":"input_json_delta","partial_json":'
+_DELTA_TAIL = b"}}\n\n"
+_STOP_HEAD = b'event: content_block_stop\ndata: {"type":"content_block_stop","index":'
+_START_HEAD = b'event: content_block_start\ndata: {"type":"content_block_start","index":'
+_TEXT_START_TAIL = b',"content_block":{"type":"text","text":""}}\n\n'
+_TOOL_START_MID = b',"content_block":{"type":"tool_use","id":'
+_TOOL_START_NAME = b',"name":'
+_TOOL_START_TAIL = b',"input":{}}}\n\n'
+
+
+def encode_frame(event: str, data: dict) -> bytes:
+    """일반 프레임 (message_start/message_delta/message_stop 등)"""
+    return b"".join((b"event: ", event.encode(), b"\ndata: ", _json_bytes(data), b"\n\n"))
+
+
+def text_delta_frame(index: int, text: str) -> bytes:
+    return b"".join((_DELTA_HEAD, _index(index), _TEXT_DELTA_MID, _json_str(text), _DELTA_TAIL))
+
+
+def input_json_delta_frame(index: int, partial_json: str) -> bytes:
+    return b"".join((_DELTA_HEAD, _index(index), _JSON_DELTA_MID, _json_str(partial_json), _DELTA_TAIL))
+
+
+def text_block_start_frame(index: int) -> bytes:
+    return b"".join((_START_HEAD, _index(index), _TEXT_START_TAIL))
+
+
+def tool_block_start_frame(index: int, tool_id: str, name: str) -> bytes:
+    return b"".join((
+        _START_HEAD, _index(index), _TOOL_START_MID, _json_str(tool_id),
+        _TOOL_START_NAME, _json_str(name), _TOOL_START_TAIL,
+    ))
+
+
+def block_stop_frame(index: int) -> bytes:
+    return b"".join((_STOP_HEAD, _index(index), b"}\n\n"))
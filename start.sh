@@ -25,6 +25,16 @@ if [ ! -d "$SCRIPT_DIR/.venv" ]; then
   "$SCRIPT_DIR/.venv/bin/pip" install -q -r "$SCRIPT_DIR/requirements.txt"
 fi
 
+# 프록시가 준비될 때까지 /ready 폴링 (최대 15초) - 0: 준비, 1: 프록시 종료됨, 2: 시간 초과
+wait_ready() {
+  for _ in $(seq 1 150); do
+    curl -sf "http://localhost:$PORT/ready" >/dev/null 2>&1 && return 0
+    kill -0 "$1" 2>/dev/null || return 1
+    sleep 0.1
+  done
+  return 2
+}
+
 echo "🚀 Codex-Claude Proxy 시작 (port: $PORT)"
 echo ""
 
@@ -38,7 +48,17 @@ case "${1:-proxy}" in
     # 프록시 + Claude Code 동시 실행
     "$SCRIPT_DIR/.venv/bin/python" "$SCRIPT_DIR/server.py" &
     PROXY_PID=$!
-    sleep 2
+    wait_ready $PROXY_PID
+    case $? in
+      1)
+        echo "❌ 프록시 실행 실패"
+        exit 1
+        ;;
+      2)
+        # 프록시는 살아 있음 (토큰 갱신/사전 연결이 느린 경우) → 그대로 진행
+        echo "⚠️  프록시 준비 확인 시간 초과 - Claude Code를 그대로 시작합니다"
+        ;;
+    esac
 
     echo "🔗 Claude Code 시작 (OpenAI 백엔드)..."
     ANTHROPIC_AUTH_TOKEN="sk-proxy-codex" \
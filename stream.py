@@ -1,222 +1,123 @@
 """ChatGPT Responses API 스트리밍 → Anthropic SSE 이벤트 변환"""
+import asyncio
 import json
-import uuid
+import logging
+import os
+import time
 from typing import AsyncIterator
 
+from log import get_logger
+from reducer import ResponseReducer
+from sse import aiter_sse_json
+import session
+
+logger = get_logger("stream")
+
+# 델타 병합: 같은 블록의 연속 델타를 N자까지 모아 한 프레임으로 전송 (0이면 비활성)
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", "0"))
+# 병합 중인 델타를 최대 N ms 안에는 내보냄
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "20"))
+
 
 async def convert_stream(
     response_stream: AsyncIterator[bytes],
     model: str,
-) -> AsyncIterator[str]:
-    """Responses API SSE → Anthropic Messages SSE 변환"""
+) -> AsyncIterator[bytes]:
+    """Responses API SSE → Anthropic Messages SSE 변환 (프레임은 bytes)"""
+    async for frame in convert_events(aiter_sse_json(response_stream), model):
+        yield frame
+
+
+async def convert_events(
+    events: AsyncIterator[dict],
+    model: str,
+    record_usage: bool = True,
+) -> AsyncIterator[bytes]:
+    """파싱된 Responses 이벤트 → Anthropic Messages SSE 프레임
 
-    msg_id = f"msg_{uuid.uuid4().hex[:24]}"
-    block_idx = 0
-    in_text_block = False
-    input_tokens = 0
-    output_tokens = 0
+    record_usage=False 이면 프롬프트 캐시 통계에 반영하지 않음 (응답 캐시 재생 등)
+    """
+    reducer = ResponseReducer(model, coalesce_bytes=STREAM_COALESCE_BYTES)
 
     # message_start 이벤트
-    yield _sse("message_start", {
-        "type": "message_start",
-        "message": {
-            "id": msg_id,
-            "type": "message",
-            "role": "assistant",
-            "content": [],
-            "model": model,
-            "stop_reason": None,
-            "stop_sequence": None,
-            "usage": {"input_tokens": 0, "output_tokens": 0},
-        },
-    })
-
-    async for line in _iter_sse_lines(response_stream):
-        try:
-            event = json.loads(line)
-        except json.JSONDecodeError:
+    for frame in reducer.start():
+        yield frame
+
+    async for event in _events(events, reducer):
+        if event is None:
+            # flush 간격 만료 - 모아 둔 델타 전송
+            for frame in reducer.flush():
+                yield frame
             continue
 
-        etype = event.get("type", "")
-
-        # function_call 관련 이벤트 상세 로깅
-        if "function_call" in etype:
-            print(f"[stream] 📋 Event: {etype}")
-            print(f"[stream] 📋 Event data: {json.dumps(event, ensure_ascii=False)[:200]}")
-
-        # 텍스트 출력 시작
-        if etype == "response.output_text.delta":
-            if not in_text_block:
-                yield _sse("content_block_start", {
-                    "type": "content_block_start",
-                    "index": block_idx,
-                    "content_block": {"type": "text", "text": ""},
-                })
-                in_text_block = True
-
-            yield _sse("content_block_delta", {
-                "type": "content_block_delta",
-                "index": block_idx,
-                "delta": {
-                    "type": "text_delta",
-                    "text": event.get("delta", ""),
-                },
-            })
-
-        # 텍스트 블록 완료
-        elif etype == "response.output_text.done":
-            if in_text_block:
-                yield _sse("content_block_stop", {
-                    "type": "content_block_stop",
-                    "index": block_idx,
-                })
-                block_idx += 1
-                in_text_block = False
-
-        # function_call 시작
-        elif etype == "response.function_call_arguments.delta":
-            call_id = event.get("call_id", "")
-            # 새 function_call 블록이면 시작 이벤트
-            if not hasattr(convert_stream, f"_fc_{call_id}"):
-                setattr(convert_stream, f"_fc_{call_id}", True)
-                tool_name = event.get("name", "")
-                print(f"[stream] 🔨 Tool call started: {tool_name} (id: {call_id})")
-
-                if in_text_block:
-                    yield _sse("content_block_stop", {
-                        "type": "content_block_stop",
-                        "index": block_idx,
-                    })
-                    block_idx += 1
-                    in_text_block = False
-
-                yield _sse("content_block_start", {
-                    "type": "content_block_start",
-                    "index": block_idx,
-                    "content_block": {
-                        "type": "tool_use",
-                        "id": call_id,
-                        "name": tool_name,
-                        "input": {},
-                    },
-                })
-
-            yield _sse("content_block_delta", {
-                "type": "content_block_delta",
-                "index": block_idx,
-                "delta": {
-                    "type": "input_json_delta",
-                    "partial_json": event.get("delta", ""),
-                },
-            })
-
-        # function_call 완료
-        elif etype == "response.function_call_arguments.done":
-            yield _sse("content_block_stop", {
-                "type": "content_block_stop",
-                "index": block_idx,
-            })
-            block_idx += 1
-
-        # output item 완료
-        elif etype == "response.output_item.done":
-            item = event.get("item", {})
-            item_type = item.get("type", "")
-
-            if item_type == "function_call" and not in_text_block:
-                # function_call item이 한번에 온 경우
-                call_id = item.get("call_id", f"toolu_{uuid.uuid4().hex[:24]}")
-                name = item.get("name", "")
-                args = item.get("arguments", "{}")
-
-                yield _sse("content_block_start", {
-                    "type": "content_block_start",
-                    "index": block_idx,
-                    "content_block": {
-                        "type": "tool_use",
-                        "id": call_id,
-                        "name": name,
-                        "input": {},
-                    },
-                })
-                yield _sse("content_block_delta", {
-                    "type": "content_block_delta",
-                    "index": block_idx,
-                    "delta": {
-                        "type": "input_json_delta",
-                        "partial_json": args,
-                    },
-                })
-                yield _sse("content_block_stop", {
-                    "type": "content_block_stop",
-                    "index": block_idx,
-                })
-                block_idx += 1
-
-        # 응답 완료
-        elif etype == "response.completed":
-            resp = event.get("response", {})
-            usage = resp.get("usage", {})
-            input_tokens = usage.get("input_tokens", 0)
-            output_tokens = usage.get("output_tokens", 0)
-
-            # 열린 블록 닫기
-            if in_text_block:
-                yield _sse("content_block_stop", {
-                    "type": "content_block_stop",
-                    "index": block_idx,
-                })
-
-            output = resp.get("output", [])
-            has_tool = any(i.get("type") == "function_call" for i in output)
-            stop_reason = "tool_use" if has_tool else "end_turn"
-
-            # 스트리밍 응답 완료 로깅
-            print(f"[proxy] 🎬 Stream completed | stop_reason: {stop_reason} | "
-                  f"has_tool: {has_tool} | output_tokens: {output_tokens}")
-
-            yield _sse("message_delta", {
-                "type": "message_delta",
-                "delta": {"stop_reason": stop_reason, "stop_sequence": None},
-                "usage": {"output_tokens": output_tokens},
-            })
+        # function_call 관련 이벤트 상세 로깅 (DEBUG일 때만 직렬화)
+        if logger.isEnabledFor(logging.DEBUG) and "function_call" in event.get("type", ""):
+            logger.debug("📋 Event: %s", event.get("type"))
+            logger.debug("📋 Event data: %s", json.dumps(event, ensure_ascii=False)[:200])
+
+        for frame in reducer.feed(event):
+            yield frame
+
+        # 스트리밍 응답 완료 로깅
+        if event.get("type") == "response.completed":
+            if record_usage:
+                session.record_usage(reducer.input_tokens, reducer.cached_tokens)
+            logger.info("🎬 Stream completed | stop_reason: %s | has_tool: %s | "
+                        "output_tokens: %d | cached: %d/%d",
+                        reducer.stop_reason, reducer.has_tool, reducer.output_tokens,
+                        reducer.cached_tokens, reducer.input_tokens)
 
     # message_stop
-    yield _sse("message_stop", {"type": "message_stop"})
-
-
-def _sse(event: str, data: dict) -> str:
-    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
-
-
-async def _iter_sse_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
-    """바이트 스트림에서 SSE data: 라인 추출 (UTF-8 안전)"""
-    import codecs
-
-    buffer = ""
-    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
-
-    async for chunk in stream:
-        if isinstance(chunk, bytes):
-            # Incremental decoder를 사용하여 불완전한 UTF-8 문자 처리
-            text = decoder.decode(chunk, False)
-        else:
-            text = chunk
-
-        buffer += text
-        while "\n" in buffer:
-            line, buffer = buffer.split("\n", 1)
-            line = line.strip()
-            if line.startswith("data: "):
-                payload = line[6:]
-                if payload != "[DONE]":
-                    yield payload
-
-    # 마지막 남은 바이트 처리
-    final_text = decoder.decode(b"", True)
-    if final_text:
-        buffer += final_text
-        if buffer.strip().startswith("data: "):
-            payload = buffer.strip()[6:]
-            if payload != "[DONE]":
-                yield payload
+    for frame in reducer.finish():
+        yield frame
+
+
+async def _events(
+    events: AsyncIterator[dict], reducer: ResponseReducer
+) -> AsyncIterator[dict | None]:
+    """업스트림 이벤트 전달 + 병합 중인 델타의 flush 시점이 되면 None 전달
+
+    병합 중인 델타가 없을 때는 그대로 await 하고, 있을 때만 남은 시간을
+    타임아웃으로 다음 이벤트를 기다린다 (대기 중인 __anext__ 작업은 유지).
+    """
+    if reducer.coalesce_bytes <= 0:
+        async for event in events:
+            yield event
+        return
+
+    interval = STREAM_COALESCE_MS / 1000
+    iterator = events.__aiter__()
+    next_event: asyncio.Future | None = None
+    try:
+        while True:
+            if reducer.has_pending:
+                remaining = reducer.pending_since + interval - time.monotonic()
+                if remaining <= 0:
+                    yield None
+                    continue
+                if next_event is None:
+                    next_event = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait({next_event}, timeout=remaining)
+                if not done:
+                    yield None
+                    continue
+                future, next_event = next_event, None
+                try:
+                    event = future.result()
+                except StopAsyncIteration:
+                    return
+            elif next_event is not None:
+                future, next_event = next_event, None
+                try:
+                    event = await future
+                except StopAsyncIteration:
+                    return
+            else:
+                try:
+                    event = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield event
+    finally:
+        if next_event is not None:
+            next_event.cancel()
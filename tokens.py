@@ -0,0 +1,244 @@
+"""입력 토큰 계산 - /v1/messages/count_tokens 용
+
+tiktoken이 설치되어 있으면 실제 BPE 토크나이저(o200k_base)를 사용하고
+(서버 시작 시 백그라운드 스레드에서 로드, 요청 경로에서는 로드/다운로드하지 않음),
+로드 전이거나 없으면 GPT 계열 프리토크나이저 규칙을 흉내낸 오프라인 추정기를 사용한다.
+메시지/도구/system 단위로 내용 해시 → 토큰 수를 캐시하므로, 대화가 길어져도
+매 호출마다 새로 추가된 메시지만 토큰화한다.
+"""
+import asyncio
+import base64
+import json
+import os
+import re
+import struct
+
+from cache import LRUCache, canonical_json, digest
+from log import get_logger
+
+logger = get_logger("tokens")
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+TOKEN_CACHE_ENTRIES = int(os.getenv("TOKEN_CACHE_ENTRIES", "8192"))
+
+# 메시지/도구 정의마다 붙는 포맷 오버헤드 (대략치)
+MESSAGE_OVERHEAD = 4
+TOOL_OVERHEAD = 8
+# 이미지 토큰: Anthropic 기준 (가로 × 세로) / 750, 긴 변 1568px로 축소 → 최대 약 1600
+IMAGE_MAX_TOKENS = 1600
+IMAGE_PIXELS_PER_TOKEN = 750
+IMAGE_MAX_EDGE = 1568
+
+_cache = LRUCache(TOKEN_CACHE_ENTRIES)
+_encoder = None
+_encoder_loaded = False
+_pretoken_re: re.Pattern | None = None
+
+# 추정기용 프리토크나이저: 단어, 숫자 1~3자리, 공백, 기호, 비ASCII 문자
+# (컴파일에 ~8ms - 서버 시작을 늦추지 않도록 처음 추정할 때 컴파일)
+_PRETOKEN_PATTERN = (
+    r"""'(?:[sdmt]|ll|ve|re)| ?[A-Za-z]+| ?[0-9]{1,3}|\s+(?!\S)|\s+| ?[^\sA-Za-z0-9\u0080-\uffff]+|[\u0080-\uffff]"""
+)
+
+
+def _load_encoder():
+    """tiktoken 인코더 로드 (vocab 캐시가 없으면 다운로드 - 이벤트 루프 밖에서 실행)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.info("tiktoken 사용 불가 (%s) → 오프라인 추정기 사용", e)
+        return None
+
+
+async def load_encoder():
+    """서버 시작 시 백그라운드에서 호출 - 로드 전까지는 추정기 사용"""
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return
+    _encoder_loaded = True
+    encoder = await asyncio.to_thread(_load_encoder)
+    if encoder is not None:
+        _encoder = encoder
+        _cache.clear()  # 추정치로 캐시된 값 폐기
+
+
+def _estimate_tokens(text: str) -> int:
+    """BPE 토큰 수 근사치 (영문 단어는 ~4자당 1토큰, 한글 등 비ASCII는 글자당 ~1토큰)"""
+    count = 0
+    global _pretoken_re
+    if _pretoken_re is None:
+        _pretoken_re = re.compile(_PRETOKEN_PATTERN)
+    for piece in _pretoken_re.findall(text):
+        n = len(piece)
+        if n <= 4 or piece[-1] >= "\u0080":
+            count += 1
+        else:
+            count += (n + 3) // 4
+    return count
+
+
+def count_text(text: str) -> int:
+    if not text:
+        return 0
+    if _encoder is not None:
+        return len(_encoder.encode_ordinary(text))
+    return _estimate_tokens(text)
+
+
+def _image_dimensions(data: bytes) -> tuple[int, int] | None:
+    """PNG/GIF/JPEG/WebP 헤더에서 (가로, 세로) 추출"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        if data[12:16] == b"VP8X":
+            w = int.from_bytes(data[24:27], "little") + 1
+            h = int.from_bytes(data[27:30], "little") + 1
+            return w, h
+        if data[12:16] == b"VP8 ":
+            w, h = struct.unpack("<HH", data[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        return None
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            seg_len = struct.unpack(">H", data[i + 2:i + 4])[0]
+            # SOF0~SOF15 (DHT/JPG/DAC 제외)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return w, h
+            i += 2 + seg_len
+    return None
+
+
+def count_image(source: dict) -> int:
+    """이미지 블록 토큰 수 (크기를 알 수 없으면 최대치)"""
+    if source.get("type") != "base64":
+        return IMAGE_MAX_TOKENS
+    # 헤더만 필요 - 앞부분만 디코드 (JPEG SOF가 뒤에 있을 수 있어 여유 있게)
+    head = source.get("data", "")[:87384]
+    try:
+        raw = base64.b64decode(head[: len(head) // 4 * 4])
+    except ValueError:
+        return IMAGE_MAX_TOKENS
+    dims = _image_dimensions(raw)
+    if not dims or not all(dims):
+        return IMAGE_MAX_TOKENS
+    w, h = dims
+    scale = min(1.0, IMAGE_MAX_EDGE / max(w, h))
+    tokens = int(w * scale) * int(h * scale) // IMAGE_PIXELS_PER_TOKEN
+    return max(1, min(tokens, IMAGE_MAX_TOKENS))
+
+
+def _count_content(content) -> int:
+    """메시지 content (문자열 또는 블록 리스트) 토큰 수"""
+    if isinstance(content, str):
+        return count_text(content)
+    if not isinstance(content, list):
+        return count_text(str(content))
+
+    total = 0
+    for block in content:
+        btype = block.get("type")
+        if btype == "text":
+            total += count_text(block.get("text", ""))
+        elif btype == "tool_use":
+            total += count_text(block.get("name", ""))
+            total += count_text(json.dumps(block.get("input", {}), ensure_ascii=False))
+        elif btype == "tool_result":
+            total += _count_content(block.get("content", ""))
+        elif btype == "image":
+            total += count_image(block.get("source", {}))
+        elif btype == "thinking":
+            total += count_text(block.get("thinking", ""))
+        elif btype == "document":
+            source = block.get("source", {})
+            if source.get("type") == "text":
+                total += count_text(source.get("data", ""))
+            else:
+                total += count_text(json.dumps(source, ensure_ascii=False))
+    return total
+
+
+def _cached(kind: str, obj, counter) -> int:
+    """내용 해시 → 토큰 수 캐시"""
+    key = kind + digest(canonical_json(obj))
+    tokens = _cache.get(key)
+    if tokens is None:
+        tokens = counter(obj)
+        _cache.put(key, tokens)
+    return tokens
+
+
+def _count_message(msg: dict) -> int:
+    return MESSAGE_OVERHEAD + _count_content(msg.get("content", ""))
+
+
+def _count_tool(tool: dict) -> int:
+    return (
+        TOOL_OVERHEAD
+        + count_text(tool.get("name", ""))
+        + count_text(tool.get("description", ""))
+        + count_text(json.dumps(tool.get("input_schema", {}), ensure_ascii=False))
+    )
+
+
+def count_request_tokens(body: dict) -> dict:
+    """Anthropic 요청 body의 입력 토큰 수 (system/tools/messages 별 내역 포함)"""
+    system = body.get("system") or ""
+    if isinstance(system, list):
+        system = " ".join(b.get("text", "") for b in system if b.get("type") == "text")
+    system_tokens = _cached("s", system, count_text) if system else 0
+
+    tool_tokens = sum(_cached("t", t, _count_tool) for t in body.get("tools") or [])
+    messages = body.get("messages", [])
+    message_tokens = sum(_cached("m", m, _count_message) for m in messages)
+
+    return {
+        "input_tokens": system_tokens + tool_tokens + message_tokens,
+        "system": system_tokens,
+        "tools": tool_tokens,
+        "messages": message_tokens,
+        "message_count": len(messages),
+    }
+
+
+def count_input_item(item: dict) -> int:
+    """Responses API input item 토큰 수 (context window 계산용, 내용 해시 캐시)"""
+    return _cached("i", item, _count_input_item)
+
+
+def _count_input_item(item: dict) -> int:
+    itype = item.get("type")
+    if itype == "message":
+        total = MESSAGE_OVERHEAD
+        for part in item.get("content", ()):
+            if part.get("type") == "input_image":
+                total += IMAGE_MAX_TOKENS  # data URI에서 크기를 읽지 않고 최대치로
+            else:
+                total += count_text(part.get("text", ""))
+        return total
+    if itype == "function_call":
+        return MESSAGE_OVERHEAD + count_text(item.get("name", "")) + count_text(item.get("arguments", ""))
+    if itype == "function_call_output":
+        return MESSAGE_OVERHEAD + count_text(item.get("output", ""))
+    return MESSAGE_OVERHEAD + count_text(json.dumps(item, ensure_ascii=False))
+
+
+def count_preamble(instructions: str, tools: list | None) -> int:
+    """instructions + 변환된 tools 토큰 수"""
+    total = _cached("s", instructions, count_text)
+    if tools:
+        total += _cached("r", tools, lambda t: count_text(json.dumps(t, ensure_ascii=False)))
+    return total
+
+
+def token_cache_stats() -> dict:
+    stats = _cache.stats()
+    stats["backend"] = "tiktoken" if _encoder is not None else "estimate"
+    return stats
@@ -0,0 +1,268 @@
+"""업스트림 공유 HTTP 클라이언트 - 커넥션 풀 + keep-alive + (선택) HTTP/2 + 이벤트 스트림 + 재시도"""
+import asyncio
+import os
+import random
+import time
+from contextlib import aclosing
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from log import get_logger
+from sse import aiter_sse_json
+import fastjson
+import metrics
+
+logger = get_logger("upstream")
+
+# 타임아웃 (초)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "300"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+
+# 커넥션 풀 설정
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "120"))
+
+# HTTP/2 멀티플렉싱 (h2 패키지 필요: pip install 'httpx[http2]')
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+
+# 첫 이벤트 전 재시도 (429/5xx/연결 오류) - 모델당 추가 시도 횟수
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+# 지수 백오프 기준/상한 (초, full jitter 적용)
+UPSTREAM_RETRY_BASE = float(os.getenv("UPSTREAM_RETRY_BASE", "0.5"))
+UPSTREAM_RETRY_MAX = float(os.getenv("UPSTREAM_RETRY_MAX", "8"))
+# Retry-After가 이보다 길면 기다리지 않고 다음 모델로 failover (또는 실패)
+UPSTREAM_RETRY_MAX_WAIT = float(os.getenv("UPSTREAM_RETRY_MAX_WAIT", "20"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+# (모델, 연결 함수) → 이벤트 스트림: 시도 단위로 끼어드는 훅 (스케줄러 슬롯 등)
+Admit = Callable[[str, Callable[[], Awaitable[AsyncIterator[dict]]]], Awaitable[AsyncIterator[dict]]]
+
+_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_client() -> httpx.AsyncClient:
+    """풀 설정이 적용된 AsyncClient 생성"""
+    http2 = UPSTREAM_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("UPSTREAM_HTTP2=true 이지만 h2 미설치 → HTTP/1.1 사용")
+        http2 = False
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+
+async def startup():
+    """앱 시작 시 공유 클라이언트 생성 (FastAPI lifespan)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+
+
+async def shutdown():
+    """앱 종료 시 커넥션 풀 정리"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def warm_up(url: str, timeout: float = 5.0) -> bool:
+    """업스트림에 미리 연결 (DNS + TCP + TLS) → 첫 요청이 핸드셰이크를 기다리지 않음
+
+    응답 상태는 상관없고 연결이 풀에 남으면 성공.
+    """
+    try:
+        await get_client().head(url, timeout=timeout)
+    except httpx.HTTPError as e:
+        logger.warning("업스트림 사전 연결 실패: %s", e)
+        return False
+    return True
+
+
+def get_client() -> httpx.AsyncClient:
+    """공유 클라이언트 반환 (lifespan 밖에서 호출되면 지연 생성)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+class UpstreamError(Exception):
+    """업스트림이 200이 아닌 상태 코드로 응답"""
+
+    def __init__(self, status_code: int, body: bytes, headers: httpx.Headers | None = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or httpx.Headers()
+        super().__init__(f"HTTP {status_code}")
+
+    @property
+    def message(self) -> str:
+        return self.body.decode("utf-8", "replace")[:500]
+
+
+async def _stream_events(url: str, payload: bytes, headers: dict) -> AsyncIterator[dict]:
+    client = get_client()
+    started = time.perf_counter()
+    headers = {**headers, "Content-Type": "application/json"}
+    async with client.stream("POST", url, content=payload, headers=headers) as resp:
+        metrics.UPSTREAM_CONNECT_SECONDS.observe(
+            metrics.current_labels.get(), time.perf_counter() - started
+        )
+        if resp.status_code != 200:
+            error_body = await resp.aread()
+            raise UpstreamError(resp.status_code, error_body, resp.headers)
+        async for event in aiter_sse_json(resp.aiter_bytes()):
+            yield event
+
+
+async def open_events(url: str, body: dict | bytes, headers: dict) -> AsyncIterator[dict]:
+    """업스트림 연결 후 첫 이벤트까지 받은 이벤트 스트림 반환
+
+    연결 실패/비정상 상태 코드는 클라이언트에 아무것도 보내기 전에 여기서 예외로 드러난다.
+    body는 dict 또는 미리 직렬화한 JSON bytes (재시도마다 다시 직렬화하지 않도록).
+    """
+    payload = body if isinstance(body, bytes) else fastjson.dumps(body)
+    events = _stream_events(url, payload, headers)
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        # 이벤트 없이 끊긴 응답 → 연결 끊김과 같이 취급 (재시도 대상)
+        raise httpx.RemoteProtocolError("upstream closed before the first event") from None
+    except BaseException:
+        await events.aclose()
+        raise
+    return _chain(first, events)
+
+
+async def _chain(first: dict, events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    async with aclosing(events):
+        yield first
+        async for event in events:
+            yield event
+
+
+# 재시도 통계
+_retry_stats = {"requests": 0, "attempts": 0, "retries": 0, "failovers": 0,
+                "recovered": 0, "failed": 0, "errors": {}}
+
+
+def retry_after(headers: httpx.Headers) -> float | None:
+    """Retry-After 헤더 (초 또는 HTTP 날짜) → 대기 시간(초)"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(UPSTREAM_RETRY_MAX, UPSTREAM_RETRY_BASE * 2 ** attempt))
+
+
+async def open_events_retrying(
+    url: str,
+    body: dict,
+    headers: dict,
+    models: list[str] | None = None,
+    retry_statuses: set[int] = RETRY_STATUSES,
+    admit: Admit | None = None,
+    prepare: Callable[[dict], object] | None = None,
+) -> AsyncIterator[dict]:
+    """재시도 + 모델 failover 포함 open_events
+
+    첫 이벤트를 받기 전까지만 재시도하므로 클라이언트에는 아무 프레임도 나가지 않은 상태다.
+    모델마다 UPSTREAM_RETRIES번까지 재시도(Retry-After 우선, 없으면 jitter 지수 백오프)하고,
+    그래도 실패하면 models의 다음 모델로 넘어간다. retry_statuses에 없는 상태 코드는 바로 전달.
+    admit(model, opener)가 있으면 시도마다 그 모델 기준으로 감싸서 연다 (스케줄러 슬롯).
+    prepare(body)가 있으면 failover 모델용 body 사본에 적용한다 (그 모델 context window에 맞추기).
+    """
+    _retry_stats["requests"] += 1
+    errors = _retry_stats["errors"]
+    last_error: Exception | None = None
+    for index, model in enumerate(models or [body.get("model")]):
+        attempt_body = body
+        if index:
+            attempt_body = {**body, "model": model}
+            _retry_stats["failovers"] += 1
+            logger.warning("↪ Failover → %s", model)
+            if prepare is not None:
+                prepare(attempt_body)
+        # 모델마다 한 번만 직렬화 (공백 없는 JSON)
+        payload = fastjson.dumps(attempt_body)
+
+        for attempt in range(UPSTREAM_RETRIES + 1):
+            _retry_stats["attempts"] += 1
+            try:
+                if admit is None:
+                    events = await open_events(url, payload, headers)
+                else:
+                    events = await admit(model, lambda: open_events(url, payload, headers))
+            except UpstreamError as e:
+                if e.status_code not in retry_statuses:
+                    _retry_stats["failed"] += 1
+                    raise
+                last_error, reason, delay = e, str(e.status_code), retry_after(e.headers)
+            except httpx.TransportError as e:
+                # 읽기 타임아웃은 이미 UPSTREAM_TIMEOUT만큼 기다린 것이므로 재시도하지 않음
+                if isinstance(e, httpx.ReadTimeout):
+                    _retry_stats["failed"] += 1
+                    raise
+                last_error, reason, delay = e, type(e).__name__, None
+            else:
+                if attempt or index:
+                    _retry_stats["recovered"] += 1
+                return events
+
+            errors[reason] = errors.get(reason, 0) + 1
+            metrics.UPSTREAM_ERRORS.inc(metrics.current_labels.get() + (reason,))
+            if attempt == UPSTREAM_RETRIES:
+                break
+            wait = _backoff(attempt) if delay is None else delay
+            if wait > UPSTREAM_RETRY_MAX_WAIT:
+                logger.warning("⏳ %s %s: Retry-After %.0fs → 재시도 생략", model, reason, wait)
+                break
+            _retry_stats["retries"] += 1
+            logger.warning("🔁 %s %s → retry %d/%d in %.2fs",
+                           model, reason, attempt + 1, UPSTREAM_RETRIES, wait)
+            await asyncio.sleep(wait)
+
+    _retry_stats["failed"] += 1
+    raise last_error
+
+
+def retry_stats() -> dict:
+    stats = dict(_retry_stats)
+    stats["errors"] = dict(_retry_stats["errors"])
+    return stats